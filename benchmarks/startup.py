@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Startup benchmark: time to import gitlab3, construct a GitLab connection
+and complete the first request, measured in fresh interpreters against a
+local stub server (no GitLab instance needed).
+
+    $ python benchmarks/startup.py [--runs 20]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter for every sample
+CHILD = r'''
+import json, sys, time
+sys.path.insert(0, %(root)r)
+t0 = time.time()
+import gitlab3
+t1 = time.time()
+gl = gitlab3.GitLab(%(url)r, 'token')
+t2 = time.time()
+project = gl.project(1)
+t3 = time.time()
+issues = project.issues()
+t4 = time.time()
+print(json.dumps({'import': t1 - t0, 'construct': t2 - t1,
+                  'first_request': t3 - t2, 'first_sub_api': t4 - t3}))
+'''
+
+PROJECT = {'id': 1, 'name': 'project', 'path': 'project',
+           'created_at': '2014-01-01T00:00:00Z',
+           'owner': {'id': 1, 'created_at': '2014-01-01T00:00:00Z'}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if '/issues' in self.path:
+            body = json.dumps([]).encode('utf-8')
+        else:
+            body = json.dumps(PROJECT).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    server = HTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+    code = CHILD % {'root': ROOT, 'url': url}
+    samples = []
+    for i in range(args.runs):
+        out = subprocess.check_output([sys.executable, '-c', code])
+        samples.append(json.loads(out.decode('utf-8').strip().splitlines()[-1]))
+    server.shutdown()
+
+    print('%-15s %10s %10s %10s' % ('phase (ms)', 'min', 'median', 'p90'))
+    for phase in ('import', 'construct', 'first_request', 'first_sub_api'):
+        values = [s[phase] * 1000 for s in samples]
+        print('%-15s %10.2f %10.2f %10.2f' % (phase, min(values),
+              percentile(values, 50), percentile(values, 90)))
+    totals = [sum(s[p] for p in ('import', 'construct', 'first_request'))
+              * 1000 for s in samples]
+    print('%-15s %10.2f %10.2f %10.2f' % ('total', min(totals),
+          percentile(totals, 50), percentile(totals, 90)))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,14 @@ Python wrapper for GitLab API v3
 """
 
 
+import hashlib
 import json
 import re
 import requests
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
 from datetime import tzinfo, timedelta, datetime
 from math import ceil
 
@@ -21,7 +26,18 @@ except ImportError:
     from urllib.parse import urlencode
 
 from . import exceptions
+from . import _context
+from .cache import ShaCache
+from .metrics import MetricsRegistry
+from .resilience import HedgingPolicy, CircuitBreaker
+from .scheduler import RequestScheduler
+from .tokens import TokenPool
+from ._streaming import _iter_json_array, _RESPONSE_CHUNK_SIZE, \
+                        upload_files as _upload_files
+from ._pool import _WorkStealingPool
+from ._walker import walk as _walk, walk_tree as _walk_tree
 from ._api_definition import GitLab as _GitLabAPIDefinition
+from ._api_definition import Project as _ProjectDefinition
 from ._api_definition import _LIST, _GET, _ADD, _EDIT, _DELETE, \
                              _HTTP_GET, _HTTP_PUT, _HTTP_POST, _HTTP_DELETE
 
@@ -35,22 +51,85 @@ ACCESS_LEVEL_OWNER = 50
 # Maximum 'per_page' value allowed by GitLab when listing
 _MAX_PER_PAGE = 100
 
+# Maximum number of concurrent requests made for expand=[...]
+_EXPAND_JOBS = 8
 
-def _query_list(api_cls, parent, data):
-    """Helper for find and list functions. Queries GitLab for an entire
-       listing of objects '_MAX_PER_PAGE' objects at a time.
+# Client-side helpers which are plain methods of the classes of some APIs
+# (they are not HTTP requests, so not extra actions)
+_METHODS = {
+    _ProjectDefinition: {
+        'walk_tree': _walk_tree,
+        'upload_files': _upload_files,
+    },
+}
+
+
+def _project_fields(api_cls, obj, fields):
+    """Keep only the requested fields (and the object's key) of obj"""
+    if fields is None:
+        return obj
+    ret = {}
+    for key in fields:
+        if key in obj:
+            ret[key] = obj[key]
+    if api_cls._key_name in obj:
+        ret[api_cls._key_name] = obj[api_cls._key_name]
+    return ret
+
+
+def _projection_data(api_definition, data, fields):
+    """Add the definition's lighter listing parameters (e.g. simple=true)
+       to data if every requested field is still returned with them
+    """
+    if fields is None or not api_definition.projection_params:
+        return
+    if set(fields) <= set(api_definition.projection_fields):
+        for key, val in api_definition.projection_params.items():
+            data.setdefault(key, val)
+
+
+class _ListResult(list):
+    """List returned by <PARENT_API>.<name>s() functions. Carries the
+       pagination metadata GitLab sent with the (last) page requested;
+       attributes are None where GitLab did not send them.
+    """
+    total = None
+    total_pages = None
+    page = None
+    per_page = None
+    next_page = None
+    prev_page = None
+
+    _pagination_headers = {
+        'total': 'x-total',
+        'total_pages': 'x-total-pages',
+        'page': 'x-page',
+        'per_page': 'x-per-page',
+        'next_page': 'x-next-page',
+        'prev_page': 'x-prev-page',
+    }
+    def _set_pagination(self, hdrs):
+        """Set the pagination attributes from the headers of the last
+           page fetched (None where a header is missing or empty)
+        """
+        for attr, header in self._pagination_headers.items():
+            setattr(self, attr, None)
+            try:
+                setattr(self, attr, int(hdrs[header]))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+
+def _query_pages(api_cls, parent, data):
+    """Yield the raw (undecoded into objects) pages of an entire listing,
+       '_MAX_PER_PAGE' objects at a time, as (objs, headers) tuples.
     """
     data['per_page'] = _MAX_PER_PAGE
     page = 0
-    last_objs = None
     while True:
         data['page'] = page
         objs, hdrs = parent._get(api_cls._uq_url, data=data, _headers=True)
-        # "hash" the list as a string for comparison to prevent deep copy
-        # (would be modified when converting date strings to datetime objects)
-        last_objs = str(objs)
-        for obj in objs:
-            yield api_cls(parent, obj)
+        yield objs, hdrs
         # GitLab doesn't always return empty list at end, may repeat last...
         try:
             page = int(hdrs['x-next-page'])
@@ -58,49 +137,226 @@ def _query_list(api_cls, parent, data):
             break
 
 
+def _query_list(api_cls, parent, data, fields=None):
+    """Helper for find and list functions. Queries GitLab for an entire
+       listing of objects '_MAX_PER_PAGE' objects at a time.
+    """
+    for objs, hdrs in _query_pages(api_cls, parent, data):
+        for obj in objs:
+            yield api_cls(parent, _project_fields(api_cls, obj, fields))
+
+
+def _probe_count(api_cls, parent, data):
+    """Count the objects of a listing when GitLab does not send X-Total:
+       find the last full page with an exponential, then binary search and
+       add the size of the page after it.
+    """
+    data['per_page'] = _MAX_PER_PAGE
+    pages = {}
+    def fetch(page):
+        if page not in pages:
+            data['page'] = page
+            pages[page] = parent._get(api_cls._uq_url, data=data)
+        return pages[page]
+    def full(page):
+        objs = fetch(page)
+        if len(objs) < _MAX_PER_PAGE:
+            return False
+        # Past the end, GitLab may repeat the last page instead of
+        # returning an empty one: then the page before it is the same
+        return page == 1 or str(objs[0]) != str(fetch(page - 1)[0])
+    if not full(1):
+        return len(fetch(1))
+    lo, hi = 1, 2  # lo: last page known to be full
+    while full(hi):
+        lo, hi = hi, hi * 2
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if full(mid):
+            lo = mid
+        else:
+            hi = mid
+    tail = fetch(hi)
+    if tail and str(tail[0]) == str(fetch(lo)[0]):
+        tail = []
+    return lo * _MAX_PER_PAGE + len(tail)
+
+
+def _add_count_fn(api, api_definition, parent):
+    """Create a <PARENT_API>.count_<name>s() function"""
+    def fn(**data):
+        query = dict(data)
+        query['per_page'] = 1
+        query['page'] = 1
+        objs, hdrs = parent._get(api._uq_url, data=query, _headers=True)
+        for header in ('x-total', 'x-total-pages'):  # equal for per_page=1
+            try:
+                return int(hdrs[header])
+            except (KeyError, TypeError, ValueError):
+                pass
+        if not objs:
+            return 0
+        return _probe_count(api, parent, dict(data))
+    setattr(parent, 'count_' + api_definition.plural_name(), fn)
+
+
+def _fill_list(ret, api, parent, limit, page, per_page, fields, data):
+    """Helper for _add_list_fn. Append the requested objects to ret as
+       their pages arrive, so ret holds the partial listing if a request
+       fails.
+    """
+    if limit:  # Give limit precedence over other params if misused
+        page = None
+        per_page = None
+    if limit and limit <= _MAX_PER_PAGE:
+        per_page = limit
+        limit = None
+
+    if page or per_page:
+        if page:
+            data['page'] = page
+        if per_page:
+            data['per_page'] = per_page
+        objs, hdrs = parent._get(api._uq_url, data=data, _headers=True)
+        ret._set_pagination(hdrs)
+        for obj in objs:
+            ret.append(api(parent, _project_fields(api, obj, fields)))
+    elif limit:
+        data['per_page'] = _MAX_PER_PAGE
+        num_pages = int(ceil(float(limit) / _MAX_PER_PAGE))
+        remainder = limit % _MAX_PER_PAGE
+        for i in range(1, num_pages+1):
+            data['page'] = i
+            objs, hdrs = parent._get(api._uq_url, data=data, _headers=True)
+            ret._set_pagination(hdrs)
+            if remainder and i == num_pages:  # Final request
+                objs = objs[:remainder]
+            for obj in objs:
+                ret.append(api(parent, _project_fields(api, obj, fields)))
+    else:  # Obtain full list
+        for objs, hdrs in _query_pages(api, parent, data):
+            ret._set_pagination(hdrs)
+            for obj in objs:
+                ret.append(api(parent, _project_fields(api, obj, fields)))
+        ret.total = len(ret)
+        ret.next_page = None
+
+
+def _stream_list(api, parent, limit, page, per_page, fields, when,
+                 priority, data):
+    """Helper for _add_list_fn. Yield the requested objects as they are
+       parsed from the responses, page after page, until the absolute
+       deadline 'when'.
+    """
+    single_page = bool(page or per_page) and not limit
+    if not per_page:
+        per_page = min(limit, _MAX_PER_PAGE) if limit else _MAX_PER_PAGE
+    data['per_page'] = per_page
+    page = page or 0
+    count = 0
+    while True:
+        data['page'] = page
+        with _context.deadline_at(when), _context.priority(priority):
+            items, hdrs = parent._get(api._uq_url, data=data, _headers=True,
+                                      _stream=True)
+        for item in items:
+            if limit and count >= limit:
+                items.close()
+                return
+            count += 1
+            yield api(parent, _project_fields(api, item, fields))
+        if single_page:
+            return
+        try:
+            page = int(hdrs['x-next-page'])
+        except (KeyError, ValueError):
+            return
+
+
+def _expand_names(api_definition, expand):
+    """Check the names given to expand=[...]: sub-API listings and extra
+       actions which are a plain GET request without arguments (wrapped
+       actions may do anything else)
+    """
+    names = set(sub.plural_name() for sub in api_definition.sub_apis
+                if _LIST in sub.actions)
+    names.update(action.name() for action in api_definition.extra_actions
+                 if getattr(action, 'method', None) == _HTTP_GET and
+                 not getattr(action, 'wrapper', None) and
+                 not action.required_params and ':' not in action.url)
+    for name in expand:
+        if name not in names:
+            raise ValueError("cannot expand '%s' of %s (expandable: %s)"
+                             % (name, api_definition.name(),
+                                ', '.join(sorted(names))))
+    return list(expand)
+
+
+def _expanded(tasks, owner):
+    """{name: result} of the expand tasks of an object, with the objects
+       of the results bound to owner
+    """
+    ret = {}
+    for name, task in tasks:
+        value = task.result()
+        for item in (value if isinstance(value, list) else [value]):
+            if isinstance(item, _GitLabAPI):
+                item._parent = owner
+        ret[name] = value
+    return ret
+
+
+def _expand_list(objs, names):
+    """Fetch the 'names' listings/actions of all objs concurrently into
+       their 'expanded' dicts
+    """
+    if not objs or not names:
+        return
+    jobs = min(_EXPAND_JOBS, len(objs) * len(names))
+    with _WorkStealingPool(jobs) as pool:
+        tasks = [(obj, [(name, pool.submit(getattr(obj, name)))
+                        for name in names])
+                 for obj in objs]
+        for obj, obj_tasks in tasks:
+            obj.expanded = _expanded(obj_tasks, obj)
+
+
 def _add_list_fn(api, api_definition, parent):
     """Create a <PARENT_API>.<name>s() function"""
-    def fn(limit=None, page=None, per_page=None, **data):
-        ret = []
-        if limit:  # Give limit precedence over other params if misused
-            page = None
-            per_page = None
-        if limit and limit <= _MAX_PER_PAGE:
-            per_page = limit
-            limit = None
-
-        if page or per_page:
-            if page:
-                data['page'] = page
-            if per_page:
-                data['per_page'] = per_page
-            objs = parent._get(api._uq_url, data=data)
-            for obj in objs:
-                ret.append(api(parent, obj))
-        elif limit:
-            data['per_page'] = _MAX_PER_PAGE
-            num_pages = int(ceil(float(limit) / _MAX_PER_PAGE))
-            remainder = limit % _MAX_PER_PAGE
-            for i in range(1, num_pages+1):
-                data['page'] = i
-                objs = parent._get(api._uq_url, data=data)
-                if remainder and i == num_pages:  # Final request
-                    objs = objs[:remainder]
-                for obj in objs:
-                    ret.append(api(parent, obj))
-        else:  # Obtain full list
-            for api_obj in _query_list(api, parent, data):
-                ret.append(api_obj)
+    def fn(limit=None, page=None, per_page=None, fields=None, deadline=None,
+           priority=None, stream=False, expand=None, **data):
+        _projection_data(api_definition, data, fields)
+        names = _expand_names(api_definition, expand or [])
+        if stream:
+            if names:
+                raise ValueError("expand cannot be used with stream=True")
+            # The generator runs later, outside of the caller's context
+            when = _context.deadline_time(deadline)
+            priority = priority or _context.get('priority')
+            return _stream_list(api, parent, limit, page, per_page, fields,
+                                when, priority, data)
+        ret = _ListResult()
+        try:
+            with _context.deadline(deadline), _context.priority(priority):
+                _fill_list(ret, api, parent, limit, page, per_page, fields,
+                           data)
+                _expand_list(ret, names)
+        except exceptions.DeadlineExceeded as e:
+            e.partial = ret
+            raise
         return ret
+    fn._api = api  # for helpers working on raw listings (e.g. gitlab3.export)
+    fn._parent = parent
     setattr(parent, api_definition.plural_name(), fn)
     return fn
 
 
-def _find_matches(objects, kwargs, find_all):
+def _find_matches(objects, kwargs, find_all, ret=None):
     """Helper function for _add_find_fn. Find objects whose properties
        match all key, value pairs in kwargs.
     """
-    ret = []
+    if ret is None:
+        ret = []
     for obj in objects:
         match = True
         # Match all supplied parameters
@@ -118,8 +374,33 @@ def _find_matches(objects, kwargs, find_all):
     return ret
 
 
-def _add_find_fn(api, name, parent):
+def _query_value(val):
+    """Format a find_<name>() criterion as a query parameter value"""
+    if isinstance(val, bool):
+        return 'true' if val else 'false'
+    if isinstance(val, (list, tuple)):
+        return ','.join(str(v) for v in val)
+    return val
+
+
+def _plan_find(api_definition, kwargs):
+    """Return the query parameters letting GitLab narrow down the listing
+       for find criteria kwargs. Query-only parameters are removed from
+       kwargs; the remaining criteria still have to be checked.
+    """
+    query = {}
+    for param in api_definition.find_query_params:
+        if param in kwargs:
+            query[param] = _query_value(kwargs.pop(param))
+    for attr, param in sorted(api_definition.find_params.items()):
+        if attr in kwargs and param not in query:
+            query[param] = _query_value(kwargs[attr])
+    return query
+
+
+def _add_find_fn(api, api_definition, parent):
     """Create a <PARENT_API>.find_<name>() function"""
+    name = api_definition.name()
     def fn(**kwargs):
         if not kwargs:
             raise TypeError("find_%s() requires at least one named argument" \
@@ -129,11 +410,18 @@ def _add_find_fn(api, name, parent):
             del kwargs['cached']
         except KeyError:
             objects = None
+        if objects:
+            for param in api_definition.find_query_params:
+                if param in kwargs:
+                    raise TypeError("find_%s(): '%s' can not be applied to "
+                                    "cached objects" % (name, param))
         try:
             find_all = kwargs['find_all']
             del kwargs['find_all']
         except KeyError:
             find_all = False
+        deadline = kwargs.pop('deadline', None)
+        priority = kwargs.pop('priority', None)
         try:
             query_data = {}
             query_data['sudo'] = kwargs['sudo']
@@ -141,22 +429,231 @@ def _add_find_fn(api, name, parent):
         except KeyError:
             pass
         if not objects:
-            objects = _query_list(api, parent, query_data)
-
-        return _find_matches(objects, kwargs, find_all)
+            query_data.update(_plan_find(api_definition, kwargs))
+        matches = []
+        try:
+            with _context.deadline(deadline), _context.priority(priority):
+                if not objects:
+                    objects = _query_list(api, parent, query_data)
+                return _find_matches(objects, kwargs, find_all, matches)
+        except exceptions.DeadlineExceeded as e:
+            e.partial = matches
+            raise
     setattr(parent, 'find_' + name, fn)
 
 
+def _watch_fingerprint(obj):
+    """Value that changes whenever a listed object changes"""
+    if obj.get('updated_at'):
+        return obj['updated_at']
+    return json.dumps(obj, sort_keys=True)
+
+
+def _add_watch_fn(api, api_definition, parent):
+    """Create a <PARENT_API>.watch_<name>s() generator function"""
+    watch_params = api_definition.watch_params
+    def fn(interval=60, min_interval=5, max_interval=600, per_page=20,
+           initial=False, max_pages=5, **data):
+        """Poll the newest page of the listing and yield new or changed
+           objects (oldest first). The poll interval is halved after a poll
+           that found changes and grows by half after an idle one, staying
+           within [min_interval, max_interval] seconds.
+        """
+        query = dict(watch_params)
+        query.update(data)
+        query['per_page'] = per_page
+        seen = OrderedDict()  # key => fingerprint, newest last
+        first = True
+        while True:
+            changed = []
+            for page in range(1, max_pages + 1):
+                query['page'] = page
+                objs = parent._get(api._uq_url, data=query)
+                overlap = False
+                for obj in objs:
+                    fingerprint = _watch_fingerprint(obj)
+                    key = obj.get(api._key_name, fingerprint)
+                    if seen.get(key) == fingerprint:
+                        overlap = True
+                        continue
+                    changed.append((key, fingerprint, obj))
+                # Only look further back if the whole page was unseen
+                if first or overlap or len(objs) < per_page:
+                    break
+            for key, fingerprint, obj in reversed(changed):
+                seen.pop(key, None)
+                seen[key] = fingerprint
+                if not first or initial:
+                    yield api(parent, obj)
+            while len(seen) > max_pages * per_page:
+                seen.popitem(last=False)
+            if changed and not first:
+                interval = max(min_interval, interval / 2.0)
+            else:
+                interval = min(max_interval, interval * 1.5)
+            first = False
+            time.sleep(interval)
+    setattr(parent, 'watch_' + api_definition.plural_name(), fn)
+
+
+def _epoch(value):
+    """Seconds since the epoch of a datetime, GitLab date string or
+       number; naive datetimes are taken to be UTC
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, datetime):
+        value = _GitLabAPI._convert_gitlab_date(value)
+    offset = value.utcoffset()
+    value = value.replace(tzinfo=None)
+    if offset is not None:
+        value -= offset
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+def _window_query(api_definition, data, lo, hi):
+    """Query data restricting a listing to the time window [lo, hi)"""
+    lower, upper = api_definition.time_window_params
+    query = dict(data)
+    if api_definition.time_window_days:
+        # Exclusive dates, in the server's time zone: widen by a day on
+        # both sides, the objects are filtered by their time anyway
+        fmt = lambda t: datetime.utcfromtimestamp(t).strftime('%Y-%m-%d')
+        query[lower] = fmt(lo - 86400)
+        query[upper] = fmt(hi + 86400)
+    else:
+        fmt = lambda t: \
+            datetime.utcfromtimestamp(t).strftime('%Y-%m-%dT%H:%M:%SZ')
+        query[lower] = fmt(lo)
+        query[upper] = fmt(hi)  # inclusive
+    return query
+
+
+def _split_window(lo, hi, parts, step):
+    """Split [lo, hi) into at most 'parts' windows aligned to 'step',
+       newest first
+    """
+    width = max(step, int(ceil(float(hi - lo) / parts / step)) * step)
+    windows = []
+    while hi > lo:
+        windows.append((max(lo, hi - width), hi))
+        hi -= width
+    return windows
+
+
+def _shard_list(api, api_definition, parent, lo, hi, jobs, shards,
+                max_pages, when, priority, data):
+    """Helper for _add_shard_fn. Fetch time windows of [lo, hi)
+       concurrently and yield their objects newest first.
+    """
+    field = api_definition.time_window_field
+    step = 86400 if api_definition.time_window_days else 1
+    start = int(lo // step) * step
+    end = int(ceil(hi / step)) * step
+    pool = _WorkStealingPool(jobs)
+    stopped = threading.Event()
+
+    def in_window(objs, a, b):
+        """(time, obj) of the objects of the window"""
+        a, b = max(a, lo), min(b, hi)
+        timed = ((_epoch(obj[field]), obj) for obj in objs)
+        return [(t, obj) for t, obj in timed if a <= t < b]
+
+    def fetch(a, b):
+        """Return ('split', [(a, b, task), ...]) if the window holds more
+           than about max_pages pages, else ('objs', [(time, obj), ...])
+        """
+        if stopped.is_set():
+            return 'objs', []
+        with _context.deadline_at(when), _context.priority(priority):
+            query = _window_query(api_definition, data, a, b)
+            query['per_page'] = _MAX_PER_PAGE
+            query['page'] = 1
+            objs, hdrs = parent._get(api._uq_url, data=query, _headers=True)
+            next_page = hdrs.get('x-next-page')
+            if next_page and b - a > step:
+                try:
+                    pages = int(hdrs['x-total-pages'])
+                except (KeyError, TypeError, ValueError):
+                    # Extrapolate from the time span of the first page
+                    oldest = min(_epoch(obj[field]) for obj in objs)
+                    span = max(step, min(b, hi) - max(a, oldest))
+                    pages = float(b - a) / span
+                parts = int(ceil(pages / max_pages))
+                if parts > 1:
+                    return 'split', [(c, d, pool.submit(fetch, c, d))
+                                     for c, d in _split_window(a, b, parts,
+                                                               step)]
+            found = in_window(objs, a, b)
+            while next_page and not stopped.is_set():
+                query['page'] = int(next_page)
+                objs, hdrs = parent._get(api._uq_url, data=query,
+                                         _headers=True)
+                found += in_window(objs, a, b)
+                next_page = hdrs.get('x-next-page')
+        found.sort(key=lambda item: item[0], reverse=True)
+        return 'objs', found
+
+    windows = deque((a, b, pool.submit(fetch, a, b))
+                    for a, b in _split_window(start, end, shards, step))
+    try:
+        while windows:
+            a, b, task = windows.popleft()
+            kind, value = task.result()
+            if kind == 'split':
+                windows.extendleft(reversed(value))
+                continue
+            for t, obj in value:
+                yield api(parent, obj)
+    finally:
+        stopped.set()
+        pool.shutdown(wait=False)
+
+
+def _add_shard_fn(api, api_definition, parent):
+    """Create a <PARENT_API>.shard_<name>s() generator function"""
+    def fn(since, until=None, jobs=8, shards=None, max_pages=5,
+           deadline=None, priority=None, **data):
+        """Yield the objects created in [since, until) (datetimes, GitLab
+           date strings or epoch seconds; until defaults to now), newest
+           first. The range is split into 'shards' time windows fetched
+           concurrently by 'jobs' threads, each with its own pagination;
+           a window found to hold more than about 'max_pages' pages is
+           split further.
+        """
+        lo = _epoch(since)
+        hi = _epoch(until) if until is not None else time.time()
+        when = _context.deadline_time(deadline)
+        priority = priority or _context.get('priority')
+        return _shard_list(api, api_definition, parent, lo, hi, jobs,
+                           shards or jobs, max_pages, when, priority, data)
+    setattr(parent, 'shard_' + api_definition.plural_name(), fn)
+
+
 def _add_get_fn(api, name, parent):
     """Create a <PARENT_API>.get_<name>() function"""
     fixed_url = api._q_url.replace('merge_requests', 'merge_request')
-    def fn(key=[], **kwargs):
-        if key and '/' in key:
+    def fn(key=[], fields=None, expand=None, **kwargs):
+        if key and not isinstance(key, int) and '/' in key:
             key = key.replace('/', '%2F')
+        names = _expand_names(api._definition, expand or [])
+        if names and key == []:  # no key to fetch the expansions with yet
+            ret = fn(fields=fields, **kwargs)
+            _expand_list([ret], names)
+            return ret
         if key != []:
             key = [key]
-        data = parent._get(fixed_url, addl_keys=key, data=kwargs)
-        ret = api(parent, data)
+        if not names:
+            data = parent._get(fixed_url, addl_keys=key, data=kwargs)
+            return api(parent, _project_fields(api, data, fields))
+        # The expansions only need the key: fetch them along with the object
+        stub = api(parent, {api._key_name: key[0]})
+        with _WorkStealingPool(min(_EXPAND_JOBS, len(names))) as pool:
+            tasks = [(name, pool.submit(getattr(stub, name)))
+                     for name in names]
+            data = parent._get(fixed_url, addl_keys=key, data=kwargs)
+            ret = api(parent, _project_fields(api, data, fields))
+            ret.expanded = _expanded(tasks, ret)
         return ret
     setattr(parent, 'get_' + name, fn)
     setattr(parent, name, fn)
@@ -166,7 +663,8 @@ def _add_create_fn(api, api_definition, parent):
     """Create a <PARENT_API>.add_<name>() function"""
     fn_name = "add_" + api_definition.name()
     required_params = api_definition.required_params
-    optional_params = api_definition.optional_params
+    # 'sudo' is an optional parameter for all functions
+    optional_params = api_definition.optional_params + ['sudo']
     def fn(*args, **kwargs):
         if len(args) < len(required_params):
             raise TypeError("%s() takes at least %d arguments (%d given)" \
@@ -258,10 +756,39 @@ def _add_extra_fn(api, action_def, parent=None):
     setattr(api, action_def.name(), fn)
 
 
-def _add_api(definition, parent):
-    """Create a new class for an api"""
-    name = definition.name()
-    sub_apis = definition.sub_apis
+class GitLabTzInfo(tzinfo):
+    """Fixed UTC offset of dates returned by GitLab"""
+    def __init__(self, utcoffset):
+        self.utcoffset_val = timedelta(minutes=utcoffset)
+    def __getinitargs__(self):  # for pickle
+        return (self.utcoffset_val.days * 1440 +
+                self.utcoffset_val.seconds // 60,)
+    def utcoffset(self, dt):
+        return self.utcoffset_val
+    def dst(self, dt):
+        return None
+
+
+class _APIType(type):
+    """Metaclass of generated API classes. Makes the classes of sub-APIs
+       available as class attributes (e.g. gitlab3.Project.Issue) without
+       generating them up front.
+    """
+    def __getattr__(cls, name):
+        if not name.startswith('_'):
+            for definition in cls._sub_apis:
+                if definition.class_name() == name:
+                    return _api_class(definition, cls)
+        raise AttributeError(name)
+
+
+# Generated classes, keyed by (definition, qualified url, unqualified url)
+_api_classes = {}
+_api_classes_lock = threading.Lock()
+
+
+def _api_class(definition, parent):
+    """Return the (cached) class for an api below parent"""
     url = definition.url
     q_url = "%s%s" % (parent._q_url, url)
     if parent._id:
@@ -269,21 +796,99 @@ def _add_api(definition, parent):
     else:
         uq_url = parent._uq_url
     uq_url += re.sub(r'/\:.*', '', url)  # "unqualify" the url
-    # 'sudo' is an optional parameter for all functions
-    definition.optional_params.append('sudo')
+    key = (definition, q_url, uq_url)
+    try:
+        return _api_classes[key]
+    except KeyError:
+        pass
+    with _api_classes_lock:
+        if key in _api_classes:
+            return _api_classes[key]
+        cls_attrs = {
+            '_definition': definition,
+            '_key_name': definition.key_name,
+            '_q_url': q_url,
+            '_uq_url': uq_url,
+            '_sub_apis': definition.sub_apis,
+        }
+        cls_attrs.update(_METHODS.get(definition, {}))
+        cls = _APIType(definition.class_name(), (_GitLabAPI,), cls_attrs)
+        for action_def in definition.extra_actions:
+            _add_extra_fn(cls, action_def, parent)
+        _api_classes[key] = cls
+    return cls
 
-    cls_attrs = {
-        '_key_name': definition.key_name,
-        '_q_url': q_url,
-        '_uq_url': uq_url,
-        '_sub_apis': sub_apis,
-    }
-    cls_name = definition.class_name()
-    cls = type(cls_name, (_GitLabAPI,), cls_attrs)
+
+def _sub_api_class(parent, class_name):
+    """Return the class of the sub-API of parent named class_name"""
+    if isinstance(parent, GitLab):
+        sub_apis = _GitLabAPIDefinition.sub_apis
+    else:
+        sub_apis = parent._sub_apis
+    for definition in sub_apis:
+        if definition.class_name() == class_name:
+            if isinstance(parent, GitLab):  # bound in GitLab.__init__
+                return _api_class(definition, parent)
+            return _add_api(definition, parent)
+    raise ValueError("'%s' has no sub-API '%s'"
+                     % (type(parent).__name__, class_name))
+
+
+def _restore(cls, parent, data):
+    """Create an object of an API class from data which was already
+       converted (i.e. without converting its dates again)
+    """
+    obj = cls.__new__(cls)
+    if cls._key_name in data:
+        obj._id = data[cls._key_name]
+    for key, val in data.items():
+        setattr(obj, key, val)
+    obj._parent = parent
+    obj._data_keys = list(data.keys())
+    return obj
+
+
+# The most recently created GitLab connection, which unpickled objects
+# are bound to
+_connection = None
+
+
+def from_state(state, gitlab=None):
+    """Recreate an object from the result of its to_state(), bound to
+       the gitlab connection (by default the most recently created one)
+    """
+    if gitlab is None:
+        gitlab = _connection
+        if gitlab is None:
+            raise RuntimeError("A GitLab connection must be created before "
+                               "objects can be restored")
+    class_path, keys, data = state
+    obj = gitlab
+    for i, class_name in enumerate(class_path):
+        cls = _sub_api_class(obj, class_name)
+        if i < len(keys):  # parents are restored with just their key
+            key = keys[i]
+            obj = _restore(cls, obj, {cls._key_name: key}
+                                     if key is not None else {})
+        else:
+            obj = _restore(cls, obj, data)
+    return obj
+
+
+def _add_api(definition, parent):
+    """Bind the functions of an api to parent, creating its class if
+       this is the first time it is needed
+    """
+    name = definition.name()
+    cls = _api_class(definition, parent)
 
     if _LIST in definition.actions:
         _add_list_fn(cls, definition, parent)
-        _add_find_fn(cls, name, parent)
+        _add_find_fn(cls, definition, parent)
+        _add_watch_fn(cls, definition, parent)
+        _add_count_fn(cls, definition, parent)
+        if definition.time_window_params:
+            _add_shard_fn(cls, definition, parent)
     if _GET in definition.actions:
         _add_get_fn(cls, name, parent)
     if _ADD in definition.actions:
@@ -292,13 +897,8 @@ def _add_api(definition, parent):
         _add_edit_fn(cls, name, parent)
     if _DELETE in definition.actions:
         _add_delete_fn(cls, name, parent)
-    for action_def in definition.extra_actions:
-        _add_extra_fn(cls, action_def, parent)
-
-    for definition in sub_apis:
-        _add_api(definition, cls)
 
-    setattr(parent, cls_name, cls)
+    setattr(parent, definition.class_name(), cls)
     return cls
 
 _session = None
@@ -309,7 +909,35 @@ class _GitLabAPI(object):
     _q_url = ''
     _uq_url = ''
     _data_keys = []
+    _sub_apis = []
     _headers = {}
+    _metrics = None
+    _sha_cache = None
+    _hedging = None
+    _circuit_breaker = None
+    _scheduler = None
+    _token_pool = None
+    _recorder = None
+    _identity_map = None
+    _identity_map_lock = threading.Lock()
+    _sub_apis_lock = threading.RLock()
+
+    def __new__(cls, parent=None, json_data=None, *args, **kwargs):
+        """With the identity map enabled, return the existing object for
+           the same resource (class, parent keys and id) if there is one
+        """
+        identity_map = cls._identity_map
+        if identity_map is None or not isinstance(parent, _GitLabAPI) or \
+                not isinstance(json_data, dict) or \
+                json_data.get(cls._key_name) is None:
+            return object.__new__(cls)
+        key = (cls, tuple(parent._get_keys()), json_data[cls._key_name])
+        with cls._identity_map_lock:
+            obj = identity_map.get(key)
+            if obj is None:
+                obj = object.__new__(cls)
+                identity_map[key] = obj
+        return obj
 
     def __init__(self, parent, json_data={}):
         try:
@@ -321,10 +949,23 @@ class _GitLabAPI(object):
         for key, val in json_data.items():
             setattr(self, key, val)
         self._parent = parent
-        self._data_keys = list(json_data.keys())
-        for sub_api in self._sub_apis:
-            _add_api(sub_api, self)
-        self._sub_apis = None
+        if '_data_keys' in self.__dict__:  # merged into by the identity map
+            self._data_keys += [key for key in json_data
+                                if key not in self._data_keys]
+        else:
+            self._data_keys = list(json_data.keys())
+
+    def __getattr__(self, name):
+        """Bind the functions and classes of sub-APIs on first use"""
+        if name.startswith('_') or '_sub_apis_bound' in self.__dict__:
+            raise AttributeError(name)
+        # Other threads wait for the binding instead of seeing it half done
+        with self._sub_apis_lock:
+            if '_sub_apis_bound' not in self.__dict__:
+                for sub_api in self._sub_apis:
+                    _add_api(sub_api, self)
+                self._sub_apis_bound = True
+        return getattr(self, name)
 
     _date_fields = {
         'created_at': True,
@@ -346,7 +987,8 @@ class _GitLabAPI(object):
             if self._date_fields.get(key) and val:
                 data[key] = self._convert_gitlab_date(val)
 
-    def _convert_gitlab_date(self, datetime_str):
+    @staticmethod
+    def _convert_gitlab_date(datetime_str):
         """Convert GitLab datetime string to datetime object"""
         fmt = '%Y-%m-%dT%H:%M:%S'
         offset = None
@@ -367,13 +1009,6 @@ class _GitLabAPI(object):
         dt = datetime.strptime(datetime_str, fmt)
         if not offset:
             return dt
-        class GitLabTzInfo(tzinfo):
-            def __init__(self, utcoffset):
-                self.utcoffset_val = timedelta(minutes=utcoffset)
-            def utcoffset(self, dt):
-                return self.utcoffset_val
-            def dst(self):
-                return None
         sign = offset[0]
         hours = int(offset[1:3])
         minutes = int(offset[-2:])
@@ -398,6 +1033,30 @@ class _GitLabAPI(object):
             data[key] = getattr(self, key, '')
         return data
 
+    def to_state(self):
+        """Compact, picklable representation of this object: its class
+           path (e.g. ('Project', 'Issue')), the keys of its parents and
+           its data. gitlab3.from_state() recreates the object. Objects
+           are pickled this way too, so they can be sent to other
+           processes, where they are bound to the connection created
+           there (e.g. in the initializer of a ProcessPoolExecutor).
+        """
+        class_path = []
+        keys = []
+        api = self
+        # Objects returned by some GitLab extra actions (e.g.
+        # find_projects_by_name()) have no parent: they are top-level
+        while api is not None and not isinstance(api, GitLab):
+            class_path.append(type(api).__name__)
+            keys.append(api._id)
+            api = api._parent
+        class_path.reverse()
+        keys.reverse()
+        return (tuple(class_path), tuple(keys[:-1]), self._get_data())
+
+    def __reduce__(self):
+        return (from_state, (self.to_state(),))
+
     def _get_keys(self, addl_keys=[]):
         ret = []
         ret += addl_keys  # want copy of addl_keys
@@ -417,17 +1076,26 @@ class _GitLabAPI(object):
         409: exceptions.ResourceConflict,
         410: exceptions.Gone,
         422: exceptions.Unprocessable,
+        429: exceptions.TooManyRequests,
         500: exceptions.ServerError,
     }
     def _check_status_code(self, status_code, url, data):
         if status_code < 400:
             return
         msg = "URL: %s, Data: %s" % (url, data)
-        raise self._code_to_exc[status_code](msg)
+        exc = self._code_to_exc.get(status_code)
+        if exc is None:  # e.g. 502, 503, 504 from a degraded instance
+            if status_code >= 500:
+                exc = exceptions.ServerError
+            else:
+                exc = exceptions.GitLabException
+        raise exc(msg)
 
-    def _get(self, api_url, addl_keys=[], data=None, _headers=False):
+    def _get(self, api_url, addl_keys=[], data=None, _headers=False,
+             _stream=False):
         """get or list"""
-        return self._request('get', api_url, addl_keys, data, _headers=_headers)
+        return self._request('get', api_url, addl_keys, data, _headers=_headers,
+                             _stream=_stream)
 
     def _post(self, api_url, addl_keys=[], data=None):
         return self._request('post', api_url, addl_keys, data)
@@ -438,33 +1106,235 @@ class _GitLabAPI(object):
     def _delete(self, api_url, addl_keys=[], data=None):
         return self._request('delete', api_url, addl_keys, data)
 
-    def _request(self, request_fn, api_url, addl_keys, data, _headers=False):
-        global _session
+    def _request(self, request_fn, api_url, addl_keys, data, _headers=False,
+                 _stream=False):
+        """Send a request and decode its response. With _stream, return
+           an iterator over the elements of the JSON array in the response,
+           parsed as the body arrives.
+        """
         url = self._get_url(api_url, addl_keys)
         #print "%s %s, data=%s" % (request_fn.__name__.upper(), url, str(data))
+        if request_fn in ['get', 'head']:
+            url = url + '?' + urlencode(data or {}, doseq=True)
+            data = None
+        url = url[:-1] if url.endswith('?') else url
+        cache = None
+        # With a TokenPool, the token (and so the user) is only picked
+        # when the request is sent
+        if request_fn == 'get' and not _stream and self._token_pool is None:
+            cache = self._sha_cache
+        if cache is not None:
+            identity = self._identity()
+            content = cache.get(url, identity)
+            if content is not None:
+                return self._decode(content, None, _headers)
+        # Wait for a scheduler slot outside of the metrics tracker: a
+        # queued request is not in flight yet
+        scheduler = self._scheduler
+        if scheduler is not None:
+            priority = scheduler.acquire()
         try:
-            if _session is None:
-                _session = requests.Session()
-            if request_fn in ['get', 'head']:
-              url = url + '?' + urlencode(data,doseq=True)
-              data=None
-            url = url[:-1] if url.endswith('?') else url
-            r = _session.request(method=request_fn, url=url, headers=self._headers, data=data,
-                           **self._requests_kwargs)
-        except requests.exceptions.RequestException:
-            msg = "'%s' request to '%s' failed" % (request_fn.__name__, url)
-            raise exceptions.ConnectionError(msg)
-        self._check_status_code(r.status_code, url, data)
+            if self._metrics is None:
+                r = self._send_recorded(request_fn, url, data, api_url,
+                                        _stream)
+                self._check_status_code(r.status_code, url, data)
+            else:
+                with self._metrics.track(request_fn, api_url) as tracker:
+                    tracker.url = url
+                    r = self._send_recorded(request_fn, url, data, api_url,
+                                            _stream)
+                    tracker.response = r
+                    self._check_status_code(r.status_code, url, data)
+        finally:
+            if scheduler is not None:
+                scheduler.release(priority)
+        if _stream:
+            items = self._iter_response(r, request_fn, url)
+            return (items, r.headers) if _headers else items
+        if cache is not None and r.status_code == 200:
+            cache.put(url, r.content, identity)
+        return self._decode(r.content, r.headers, _headers)
+
+    def _identity(self):
+        """Who requests are sent as: a hash of the access token, and the
+           sudo user (if any)
+        """
+        token = self._headers.get('PRIVATE-TOKEN') or ''
+        digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        return '%s:%s' % (digest, self._headers.get('SUDO', ''))
+
+    def _decode(self, content, headers, _headers=False):
+        """Decode a response body, along with its headers if _headers"""
         try:
             if _headers:
-                return json.loads(r.content.decode('utf-8')), r.headers
+                return json.loads(content.decode('utf-8')), headers
             else:
-                return json.loads(r.content.decode('utf-8'))
+                return json.loads(content.decode('utf-8'))
         except ValueError:  # XXX: assume we're returning plain text
             if _headers:
-                return r.content, None
+                return content, None
+            else:
+                return content
+
+    def _iter_response(self, r, request_fn, url):
+        """Yield the elements of the JSON array in a streamed response"""
+        try:
+            for item in _iter_json_array(r.iter_content(_RESPONSE_CHUNK_SIZE)):
+                yield item
+        except requests.exceptions.RequestException:
+            msg = "'%s' request to '%s' failed while reading the response" \
+                  % (request_fn.upper(), url)
+            raise exceptions.ConnectionError(msg)
+        finally:
+            r.close()
+
+    def _send_recorded(self, request_fn, url, data, api_url=None,
+                       stream=False):
+        """_send(), recording the request and its response if a Recorder
+           is configured (streamed responses are not recorded)
+        """
+        recorder = self._recorder
+        if recorder is None or stream:
+            return self._send(request_fn, url, data, api_url, stream)
+        r = self._send(request_fn, url, data, api_url, stream)
+        # The server's latency only (until the headers were parsed), not
+        # the time spent waiting for an access token
+        recorder.record(request_fn, api_url, url[len(self._base_url):], data,
+                        r, r.elapsed.total_seconds())
+        return r
+
+    def _send(self, request_fn, url, data, api_url=None, stream=False):
+        """Send a request through the circuit breaker and hedging policy
+           (if configured), returning the requests.Response
+        """
+        # Computed here: hedged attempts run in threads of their own
+        timeout, bounded = self._timeout(request_fn, url)
+        breaker = self._circuit_breaker
+        if breaker is not None:
+            breaker.before(url)
+        try:
+            # A losing streamed attempt would hold on to its connection
+            if self._hedging is not None and request_fn == 'get' and \
+                    not stream:
+                on_hedge = None
+                if self._metrics is not None:
+                    on_hedge = lambda: self._metrics.record_retry(request_fn,
+                                                                  api_url)
+                r = self._hedging.send(
+                    lambda: self._transport(request_fn, url, data, timeout,
+                                            bounded), on_hedge)
             else:
-                return r.content
+                r = self._transport(request_fn, url, data, timeout, bounded,
+                                    stream)
+        except (exceptions.DeadlineExceeded, exceptions.CircuitOpen):
+            # Failed on the client (e.g. waiting for an access token)
+            if breaker is not None:
+                breaker.release(url)
+            raise
+        except (exceptions.ConnectionError, exceptions.RequestTimeout):
+            if breaker is not None:
+                breaker.record(url, True)
+            raise
+        except BaseException:
+            # Says nothing about the host, but a half-open probe must still
+            # give its slot back
+            if breaker is not None:
+                breaker.release(url)
+            raise
+        if breaker is not None:
+            breaker.record(url, r.status_code >= 500)
+        return r
+
+    def _timeout(self, request_fn, url):
+        """Return the requests timeout for a request: the configured
+           (connect, read) timeouts, capped at the time left until the
+           deadline of the current thread, and whether the deadline capped
+           them. Raises DeadlineExceeded once the deadline has passed.
+        """
+        timeout = self._requests_kwargs.get('timeout')
+        remaining = _context.remaining()
+        if remaining is None:
+            return timeout, False
+        if remaining <= 0:
+            raise exceptions.DeadlineExceeded(
+                "Deadline exceeded before '%s' request to '%s'"
+                % (request_fn.upper(), url))
+        if timeout is None:
+            return (remaining, remaining), True
+        capped = tuple(remaining if t is None or t > remaining else t
+                       for t in timeout)
+        return capped, capped != timeout
+
+    def _transport(self, request_fn, url, data, timeout=None, bounded=False,
+                   stream=False):
+        """Send a single request, returning the requests.Response. With a
+           TokenPool, a request refused for its token (401, 429) is sent
+           again with another token, as long as there are untried ones.
+        """
+        headers = self._headers
+        streamed = hasattr(data, '__iter__') and \
+            not isinstance(data, (dict, list, tuple, str, bytes))
+        if streamed:
+            # Streamed (chunked) bodies are always form encoded
+            headers = dict(headers)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        pool = self._token_pool
+        if pool is None:
+            return self._transport_once(request_fn, url, headers, data,
+                                        timeout, bounded, stream)
+        tried = []
+        while True:
+            token = pool.acquire(exclude=tried)
+            if token is None:
+                return r
+            token_headers = dict(headers)
+            token_headers['PRIVATE-TOKEN'] = token
+            try:
+                r = self._transport_once(request_fn, url, token_headers,
+                                         data, timeout, bounded, stream)
+            except BaseException:
+                pool.release(token)
+                raise
+            pool.release(token, r.status_code, r.headers)
+            # A streamed body cannot be sent again
+            if r.status_code not in (401, 429) or streamed:
+                return r
+            tried.append(token)
+
+    def _transport_once(self, request_fn, url, headers, data, timeout=None,
+                        bounded=False, stream=False):
+        """_transport() with the given headers, without retries"""
+        global _session
+        kwargs = self._requests_kwargs
+        if timeout is not None:
+            kwargs = dict(kwargs, timeout=timeout)
+        try:
+            if _session is None:
+                _session = requests.Session()
+            return _session.request(method=request_fn, url=url,
+                                    headers=headers, data=data,
+                                    stream=stream, **kwargs)
+        except requests.exceptions.Timeout:
+            msg = "'%s' request to '%s' timed out" % (request_fn.upper(), url)
+            if bounded:
+                raise exceptions.DeadlineExceeded(msg)
+            raise exceptions.RequestTimeout(msg)
+        except requests.exceptions.RequestException:
+            msg = "'%s' request to '%s' failed" % (request_fn.upper(), url)
+            raise exceptions.ConnectionError(msg)
+
+    def walk(self, spec, jobs=8, checkpoint=None, deadline=None,
+             priority=None):
+        """Concurrently walk the listings below this object, yielding
+           (path, object) tuples as they complete, e.g.
+
+               gl.walk(['projects', ('merge_requests', {'state': 'opened'}),
+                        'notes'])
+
+           See gitlab3._walker.walk() for details.
+        """
+        return _walk(self, spec, jobs=jobs, checkpoint=checkpoint,
+                     deadline=deadline, priority=priority)
 
     def __repr__(self):
         """__repr__ function for new API class"""
@@ -473,9 +1343,33 @@ class _GitLabAPI(object):
 
 class GitLab(_GitLabAPI):
     """A GitLab API connection."""
+    _definition = _GitLabAPIDefinition
+    _extra_fns_added = False
 
     def __init__(self, gitlab_url, token=None, convert_dates=True,
-                 ssl_verify=True, ssl_cert=None):
+                 ssl_verify=True, ssl_cert=None, metrics=None,
+                 sha_cache=None, hedging=None, circuit_breaker=None,
+                 connect_timeout=None, read_timeout=None, identity_map=False,
+                 scheduler=None, token_pool=None, recorder=None):
+        """connect_timeout, read_timeout: seconds to wait for a connection
+           to GitLab and between bytes of its response; exceeding either
+           raises exceptions.RequestTimeout. Both default to waiting forever.
+           metrics: True or a gitlab3.metrics.MetricsRegistry to record
+           request metrics in (available as GitLab.metrics)
+           sha_cache: True or a gitlab3.cache.ShaCache keeping responses
+           of requests by full commit SHA, which never change
+           hedging: True or a gitlab3.resilience.HedgingPolicy for GETs
+           circuit_breaker: True or a gitlab3.resilience.CircuitBreaker
+           identity_map: keep a single object per resource while it is
+           referenced anywhere; newly fetched data is merged into it
+           scheduler: True or a gitlab3.scheduler.RequestScheduler all
+           requests wait for a slot of, by priority (see GitLab.priority)
+           token_pool: a list of tokens or a gitlab3.tokens.TokenPool to
+           spread requests over instead of sending them all with 'token'
+           recorder: a file name or gitlab3.loadtest.Recorder to record
+           requests and their responses in, for gitlab3.loadtest.replay()
+        """
+        global _connection
         if gitlab_url[-1:] == '/':
             gitlab_url = gitlab_url[:-1]
         setattr(_GitLabAPI, '_base_url', gitlab_url + "/api/v3")
@@ -484,15 +1378,66 @@ class GitLab(_GitLabAPI):
         requests_kwargs = { 'verify': ssl_verify }
         if ssl_cert is not None:
             requests_kwargs['cert'] = ssl_cert
+        if connect_timeout is not None or read_timeout is not None:
+            requests_kwargs['timeout'] = (connect_timeout, read_timeout)
         setattr(_GitLabAPI, '_requests_kwargs', requests_kwargs)
+        if metrics is True:
+            metrics = MetricsRegistry()
+        setattr(_GitLabAPI, '_metrics', metrics or None)
+        if sha_cache is True:
+            sha_cache = ShaCache()
+        setattr(_GitLabAPI, '_sha_cache', sha_cache or None)
+        if hedging is True:
+            hedging = HedgingPolicy()
+        setattr(_GitLabAPI, '_hedging', hedging or None)
+        if circuit_breaker is True:
+            circuit_breaker = CircuitBreaker()
+        setattr(_GitLabAPI, '_circuit_breaker', circuit_breaker or None)
+        setattr(_GitLabAPI, '_identity_map',
+                weakref.WeakValueDictionary() if identity_map else None)
+        if scheduler is True:
+            scheduler = RequestScheduler()
+        setattr(_GitLabAPI, '_scheduler', scheduler or None)
+        if token_pool is not None and not isinstance(token_pool, TokenPool):
+            token_pool = TokenPool(token_pool)
+        setattr(_GitLabAPI, '_token_pool', token_pool)
+        if recorder is not None:
+            from .loadtest import Recorder  # not needed unless recording
+            if not isinstance(recorder, Recorder):
+                recorder = Recorder(recorder)
+        setattr(_GitLabAPI, '_recorder', recorder)
 
         for sub_api in _GitLabAPIDefinition.sub_apis:
             cls = _add_api(sub_api, self)
             cls_name = sub_api.class_name()
             # Populate the module namespace with core classes
             globals()[cls_name] = cls
-        for action_def in _GitLabAPIDefinition.extra_actions:
-            _add_extra_fn(GitLab, action_def)
+        if not GitLab._extra_fns_added:
+            for action_def in _GitLabAPIDefinition.extra_actions:
+                _add_extra_fn(GitLab, action_def)
+            GitLab._extra_fns_added = True
+        _connection = self
+
+    def from_state(self, state):
+        """Recreate an object from its to_state(), bound to this
+           connection
+        """
+        return from_state(state, self)
+
+    @property
+    def metrics(self):
+        """The MetricsRegistry requests are recorded in, if any"""
+        return self._metrics
+
+    @property
+    def recorder(self):
+        """The Recorder requests are recorded in, if any"""
+        return self._recorder
+
+    @property
+    def token_pool(self):
+        """The TokenPool requests are sent with, if any"""
+        return self._token_pool
 
     def login(self, login_or_email, password):
         """Log in to GitLab. This is unnecessary if a token was given
@@ -521,3 +1466,37 @@ class GitLab(_GitLabAPI):
         def __exit__(self, type, value, traceback):
             headers = getattr(_GitLabAPI, '_headers')
             del headers['SUDO']
+
+    class deadline:
+        """Give every request made in a 'with' block (in this thread, and
+           by the concurrent helpers it starts) 'seconds' to complete in
+           total, e.g.
+
+               with gl.deadline(30):
+                   projects = gl.projects()
+                   issues = gl.find_project(name='foo').issues()
+
+           Requests raise exceptions.DeadlineExceeded once it has passed.
+        """
+        def __init__(self, seconds):
+            self.scope = _context.deadline(seconds)
+        def __enter__(self):
+            self.scope.__enter__()
+        def __exit__(self, type, value, traceback):
+            self.scope.__exit__(type, value, traceback)
+
+    class priority:
+        """Send every request made in a 'with' block (in this thread, and
+           by the concurrent helpers it starts) with the given priority
+           class of the RequestScheduler, e.g.
+
+               with gl.priority('batch'):
+                   for path, obj in gl.walk(['projects', 'issues']):
+                       ...
+        """
+        def __init__(self, name):
+            self.scope = _context.priority(name)
+        def __enter__(self):
+            self.scope.__enter__()
+        def __exit__(self, type, value, traceback):
+            self.scope.__exit__(type, value, traceback)
@@ -0,0 +1,462 @@
+"""
+Command line interface for listing, exporting and bulk changes, driven by
+the API definitions:
+
+    python -m gitlab3 list projects/5/issues -p state=opened
+    python -m gitlab3 export 'projects/*/merge_requests' --format csv \\
+        -o merge_requests.csv --jobs 16
+    python -m gitlab3 apply changes.ndjson --jobs 8 \\
+        --progress changes.progress [--dry-run]
+
+The connection is given with --url and --token, or the GITLAB_URL and
+GITLAB_TOKEN environment variables.
+
+Paths alternate listing names and keys, e.g. 'projects/5/issues/3'. A '*'
+in place of a key lists every object at that level, concurrently.
+
+apply reads one operation per line, calls it on the target (which is not
+fetched first) and writes one result per line:
+
+    {"target": "projects/5", "action": "add_member", "args": [3, 30]}
+    {"target": "projects/5", "action": "protect_branch", "args": ["master"]}
+    {"target": "projects/5/issues/7", "action": "save",
+     "set": {"title": "New title"}}
+    {"target": "projects/5/hooks/2", "action": "delete"}
+
+Operations recorded in the --progress file are skipped when the same input
+is applied again; failed ones are retried.
+
+--record FILE records the requests of any command with their responses;
+replay sends them again through the client against a local stub server
+serving the recorded responses, and reports throughput, latencies, CPU
+time per request and memory use (see gitlab3.loadtest):
+
+    python -m gitlab3 --record traffic.ndjson export 'projects/*/issues'
+    python -m gitlab3 --jobs 32 replay traffic.ndjson --rate 200 --repeat 5
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+
+from . import GitLab, _add_api, _restore, _walk
+from . import exceptions
+from ._api_definition import _ADD, _EDIT, _DELETE
+from ._pool import _WorkStealingPool
+from .export import iter_rows, _csv_value, _flatten, _select
+from .loadtest import replay
+from .metrics import MetricsRegistry
+
+
+class UsageError(Exception):
+    """Invalid path, operation or option"""
+
+
+def _key(value):
+    return int(value) if value.isdigit() else value
+
+
+def _sub_definition(definition, plural_name):
+    for sub_api in definition.sub_apis:
+        if sub_api.plural_name() == plural_name:
+            return sub_api
+    raise UsageError("'%s' has no listing '%s'"
+                     % (definition.class_name(), plural_name))
+
+
+def _stub(parent, definition, key):
+    """Object of the given key, without fetching it"""
+    cls = _add_api(definition, parent)
+    return _restore(cls, parent, {cls._key_name: key})
+
+
+def resolve(gl, path):
+    """Resolve 'projects/5/issues' to (project 5, ['issues'], 'projects/5')
+       and 'projects/*/issues' to (gl, ['projects', 'issues'], ''),
+       without fetching anything
+    """
+    segments = [s for s in path.strip('/').split('/') if s]
+    obj = gl
+    consumed = []
+    while len(segments) >= 2 and segments[1] != '*':
+        definition = _sub_definition(type(obj)._definition, segments[0])
+        obj = _stub(obj, definition, _key(segments[1]))
+        consumed += segments[:2]
+        segments = segments[2:]
+    names = segments[::2]
+    if any(s != '*' for s in segments[1::2]):
+        raise UsageError("Keys after a '*' must be '*' too: '%s'" % path)
+    definition = type(obj)._definition
+    for name in names:
+        definition = _sub_definition(definition, name)
+    return obj, names, '/'.join(consumed)
+
+
+def _parents(obj, names, prefix, pool):
+    """Yield (path, parent) for every parent of the last listing, walking
+       the listings above it on pool
+    """
+    if len(names) == 1:
+        yield prefix, obj
+        return
+    for path, parent in _walk(obj, names[:-1], pool=pool):
+        if len(path) == len(names) - 1:
+            steps = ['%s/%s' % step for step in path]
+            yield '/'.join([prefix] + steps if prefix else steps), parent
+
+
+def rows(gl, path, params, jobs, normalize_dates=False):
+    """Yield (parent path, raw object) for every object below path"""
+    obj, names, prefix = resolve(gl, path)
+    if not names:
+        raise UsageError("'%s' does not name a listing" % path)
+    last = names[-1]
+    if len(names) == 1:
+        for row in iter_rows(getattr(obj, last),
+                             normalize_dates=normalize_dates, **params):
+            yield prefix, row
+        return
+    def fetch(item):
+        parent_path, parent = item
+        return parent_path, list(iter_rows(getattr(parent, last),
+                                           normalize_dates=normalize_dates,
+                                           **params))
+    # A single pool for the walk and the last listings: at most 'jobs'
+    # requests in flight
+    with _WorkStealingPool(jobs) as pool:
+        for parent_path, listing in pool.imap_unordered(
+                fetch, _parents(obj, names, prefix, pool)):
+            for row in listing:
+                yield parent_path, row
+
+
+def _label(row):
+    for key in ('path_with_namespace', 'name', 'title', 'username', 'path'):
+        if row.get(key):
+            return row[key]
+    return ''
+
+
+def cmd_list(gl, args, out):
+    count = 0
+    for parent_path, row in rows(gl, args.path, args.params, args.jobs):
+        key = row.get('id', row.get('name', ''))
+        prefix = parent_path + '\t' if '*' in args.path else ''
+        out.write('%s%s\t%s\n' % (prefix, key, _label(row)))
+        count += 1
+    return count
+
+
+def cmd_export(gl, args, out):
+    columns = args.columns.split(',') if args.columns else None
+    multi = '*' in args.path
+    count = 0
+    writer = None
+    for parent_path, row in rows(gl, args.path, args.params, args.jobs,
+                                 args.normalize_dates):
+        if multi:
+            row['_parent'] = parent_path
+        if args.format == 'csv':
+            row = _flatten(row)
+            if writer is None:
+                fieldnames = list(row.keys())
+                if columns:
+                    fieldnames = columns + (['_parent'] if multi else [])
+                writer = csv.DictWriter(out, fieldnames,
+                                        extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(dict((key, _csv_value(val)) for key, val
+                                 in _select(row, writer.fieldnames).items()))
+        else:
+            if columns:
+                row = _select(row, columns + (['_parent'] if multi else []))
+            out.write(json.dumps(row) + '\n')
+        count += 1
+    return count
+
+
+def _actions(definition):
+    """Names of the actions apply may call on objects of a definition"""
+    names = set(action.name() for action in definition.extra_actions)
+    if _EDIT in definition.actions:
+        names.add('save')
+    if _DELETE in definition.actions:
+        names.add('delete')
+    for sub_api in definition.sub_apis:
+        if _ADD in sub_api.actions:
+            names.add('add_' + sub_api.name())
+    return names
+
+
+class _Operation(object):
+    def __init__(self, line_no, line):
+        self.line_no = line_no
+        self.digest = hashlib.sha1(line.encode('utf-8')).hexdigest()[:16]
+        self.op = None
+        self.target = None
+        self.error = None
+        try:
+            self.op = json.loads(line)
+            if not isinstance(self.op, dict):
+                raise ValueError("not a JSON object")
+        except ValueError as e:
+            self.error = "Invalid operation: %s" % e
+
+    def prepare(self, gl):
+        """Resolve the target and check the action. Sets self.error."""
+        if self.error:
+            return
+        try:
+            target, names, prefix = resolve(gl, self.op.get('target', ''))
+            if names:
+                raise UsageError("target must name an object, not a listing")
+            action = self.op.get('action')
+            if action not in _actions(type(target)._definition):
+                raise UsageError("'%s' is not an action of %s"
+                                 % (action, type(target).__name__))
+            self.target = target
+        except UsageError as e:
+            self.error = str(e)
+
+
+def _load_progress(filename):
+    done = set()
+    if filename and os.path.exists(filename):
+        with open(filename) as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                    done.add((entry['line'], entry['digest']))
+                except (ValueError, KeyError, TypeError):
+                    continue  # partially written last line
+    return done
+
+
+def cmd_apply(gl, args, out):
+    fp = sys.stdin if args.input == '-' else open(args.input)
+    with fp:
+        ops = [_Operation(n, line.strip()) for n, line in enumerate(fp, 1)
+               if line.strip()]
+    done = _load_progress(args.progress)
+    todo = []
+    stats = args.stats
+    for op in ops:
+        if (op.line_no, op.digest) in done:
+            stats['skipped'] += 1
+            continue
+        op.prepare(gl)
+        todo.append(op)
+
+    def run(op):
+        start = time.time()
+        result = {'line': op.line_no}
+        if op.error:
+            result['error'] = op.error
+        elif args.dry_run:
+            result['dry_run'] = '%s %s' % (op.op['action'], op.op['target'])
+        else:
+            try:
+                target = op.target
+                for key, val in (op.op.get('set') or {}).items():
+                    setattr(target, key, val)
+                    if key not in target._data_keys:
+                        target._data_keys.append(key)
+                ret = getattr(target, op.op['action'])(
+                    *(op.op.get('args') or []), **(op.op.get('kwargs') or {}))
+                result['ok'] = True
+                if getattr(ret, '_id', None) is not None:
+                    result['id'] = ret._id
+            except Exception as e:
+                result['error'] = '%s: %s' % (type(e).__name__, e)
+        return op, result, time.time() - start
+
+    progress = open(args.progress, 'a') if args.progress else None
+    try:
+        with _WorkStealingPool(max(1, args.jobs)) as pool:
+            for op, result, latency in pool.imap_unordered(run, todo):
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+                if 'error' in result:
+                    stats['failed'] += 1
+                    continue
+                stats['latencies'].append(latency)
+                if result.get('ok') and progress is not None:
+                    progress.write(json.dumps({'line': op.line_no,
+                                               'digest': op.digest}) + '\n')
+                    progress.flush()
+    finally:
+        if progress is not None:
+            progress.close()
+    return len(todo)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(round(q * (len(sorted_values) - 1)))]
+
+
+def _bucket_percentile(buckets, total, q):
+    """Upper bound of the histogram bucket holding the q-quantile"""
+    for bound, cumulative in buckets:
+        if cumulative >= q * total:
+            return bound
+    return float('inf')
+
+
+def summary(args, count, elapsed, metrics):
+    lines = []
+    rate = count / elapsed if elapsed else 0.0
+    what = 'operations' if args.command == 'apply' else 'objects'
+    line = '%d %s in %.2fs (%.1f/s)' % (count, what, elapsed, rate)
+    if args.command == 'apply':
+        line += ', %d failed, %d skipped' % (args.stats['failed'],
+                                            args.stats['skipped'])
+        latencies = sorted(args.stats['latencies'])
+        if latencies:
+            lines.append('operation latency: p50 %.3fs p95 %.3fs max %.3fs'
+                         % (_percentile(latencies, 0.5),
+                            _percentile(latencies, 0.95), latencies[-1]))
+    lines.insert(0, line)
+    snapshot = metrics.snapshot()
+    requests = sum(s['requests'] for s in snapshot.values())
+    if requests:
+        buckets = {}
+        for series in snapshot.values():
+            for bound, cumulative in series['latency_buckets']:
+                buckets[bound] = buckets.get(bound, 0) + cumulative
+        buckets = sorted(buckets.items())
+        latency_sum = sum(s['latency_sum'] for s in snapshot.values())
+        lines.append('%d requests (%.1f/s), latency: mean %.3fs '
+                     'p50 <= %gs p95 <= %gs'
+                     % (requests, requests / elapsed if elapsed else 0.0,
+                        latency_sum / requests,
+                        _bucket_percentile(buckets, requests, 0.5),
+                        _bucket_percentile(buckets, requests, 0.95)))
+    return '\n'.join(lines)
+
+
+def cmd_replay(args):
+    report = replay(args.input, concurrency=args.jobs, rate=args.rate,
+                    repeat=args.repeat, latency=args.latency,
+                    connect_timeout=args.timeout, read_timeout=args.timeout)
+    if args.json:
+        sys.stdout.write(json.dumps(report.to_dict(), sort_keys=True) + '\n')
+    else:
+        sys.stdout.write(report.render() + '\n')
+    return 1 if report.errors else 0
+
+
+def _param(value):
+    if '=' not in value:
+        raise argparse.ArgumentTypeError("expected key=value, got '%s'"
+                                         % value)
+    return value.split('=', 1)
+
+
+def parser():
+    p = argparse.ArgumentParser(prog='python -m gitlab3',
+                                description="List, export and bulk change "
+                                            "GitLab resources")
+    p.add_argument('--url', default=os.environ.get('GITLAB_URL'),
+                   help="GitLab URL (default: $GITLAB_URL)")
+    p.add_argument('--token', default=os.environ.get('GITLAB_TOKEN'),
+                   help="private token (default: $GITLAB_TOKEN)")
+    p.add_argument('--jobs', '-j', type=int, default=8,
+                   help="concurrent requests (default: 8)")
+    p.add_argument('--no-ssl-verify', dest='ssl_verify',
+                   action='store_false')
+    p.add_argument('--timeout', type=float, default=None,
+                   help="connect and read timeout in seconds")
+    p.add_argument('--quiet', '-q', action='store_true',
+                   help="no summary on stderr")
+    p.add_argument('--record', metavar='FILE',
+                   help="record requests and responses (for replay)")
+    sub = p.add_subparsers(dest='command')
+    sub.required = True
+
+    for name, help_text in (('list', "list objects, one per line"),
+                            ('export', "export objects as NDJSON or CSV")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument('path', help="e.g. projects, projects/5/issues, "
+                                      "'projects/*/merge_requests'")
+        cmd.add_argument('--param', '-p', dest='params', action='append',
+                         type=_param, default=[],
+                         help="query parameter key=value")
+        cmd.add_argument('--output', '-o', default='-')
+        if name == 'export':
+            cmd.add_argument('--format', '-f', choices=('ndjson', 'csv'),
+                             default='ndjson')
+            cmd.add_argument('--columns', '-c',
+                             help="comma separated, dotted for nested "
+                                  "values (owner.name)")
+            cmd.add_argument('--normalize-dates', action='store_true',
+                             help="convert dates to UTC ISO 8601")
+
+    cmd = sub.add_parser('apply', help="apply operations read as NDJSON")
+    cmd.add_argument('input', nargs='?', default='-',
+                     help="file of operations (default: stdin)")
+    cmd.add_argument('--progress', help="file recording completed "
+                                        "operations, to resume from")
+    cmd.add_argument('--dry-run', '-n', action='store_true',
+                     help="check operations without sending any changes")
+    cmd.add_argument('--output', '-o', default='-')
+
+    cmd = sub.add_parser('replay', help="replay recorded requests against "
+                                        "a local stub server")
+    cmd.add_argument('input', help="file written with --record")
+    cmd.add_argument('--rate', type=float, default=None,
+                     help="requests started per second (default: as many "
+                          "as --jobs allows)")
+    cmd.add_argument('--repeat', type=int, default=1,
+                     help="times to replay the recording")
+    cmd.add_argument('--latency', type=float, default=None,
+                     help="server latency in seconds (default: recorded)")
+    cmd.add_argument('--json', action='store_true',
+                     help="print the report as JSON")
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if args.command == 'replay':
+        return cmd_replay(args)
+    if not args.url:
+        sys.stderr.write("error: no GitLab URL (--url or $GITLAB_URL)\n")
+        return 2
+    if hasattr(args, 'params'):
+        args.params = dict(args.params)
+    args.stats = {'failed': 0, 'skipped': 0, 'latencies': []}
+    metrics = MetricsRegistry()
+    gl = GitLab(args.url, args.token, ssl_verify=args.ssl_verify,
+                metrics=metrics, connect_timeout=args.timeout,
+                read_timeout=args.timeout, recorder=args.record)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    command = {'list': cmd_list, 'export': cmd_export,
+               'apply': cmd_apply}[args.command]
+    start = time.time()
+    try:
+        count = command(gl, args, out)
+    except UsageError as e:
+        sys.stderr.write("error: %s\n" % e)
+        return 2
+    except exceptions.GitLabException as e:
+        sys.stderr.write("error: %s: %s\n" % (type(e).__name__, e))
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if gl.recorder is not None:
+            gl.recorder.close()
+    if not args.quiet:
+        sys.stderr.write(summary(args, count, time.time() - start, metrics)
+                         + '\n')
+    return 1 if args.stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -32,6 +32,26 @@ class APIDefinition(object):
     required_params = []
     optional_params = []
     sub_apis = []
+    # Extra query parameters used by watch_<name>s() to put recently
+    # changed objects on the first page of the listing
+    watch_params = {}
+    # Query parameters selecting a lighter variant of the listing, used
+    # when all fields requested with fields=[...] are in projection_fields
+    projection_params = {}
+    projection_fields = []
+    # find_<name>() criteria GitLab can filter the listing by: attribute
+    # => query parameter. The results are still checked client-side (e.g.
+    # 'search' matches substrings).
+    find_params = {}
+    # find_<name>() arguments which are only passed to GitLab as query
+    # parameters, never checked client-side (e.g. 'visibility')
+    find_query_params = []
+    # (lower, upper) query parameters restricting the listing to a time
+    # window of time_window_field, for shard_<name>s(). GitLab takes
+    # dates only for some listings, with exclusive bounds.
+    time_window_params = ()
+    time_window_field = 'created_at'
+    time_window_days = False
 
     @classmethod
     def name(cls):
@@ -74,6 +94,7 @@ class Member(APIDefinition):
         'user_id',
         'access_level',
     ]
+    find_params = { 'username': 'query', 'name': 'query' }
 
 
 class CurrentUser(APIDefinition):
@@ -137,6 +158,26 @@ class Project(APIDefinition):
         'repository_storage',
         'approvals_before_merge',
     ]
+    projection_params = { 'simple': 'true' }
+    find_params = { 'name': 'search', 'path': 'search' }
+    find_query_params = [ 'search', 'visibility' ]
+    projection_fields = [
+        'id',
+        'description',
+        'default_branch',
+        'tag_list',
+        'ssh_url_to_repo',
+        'http_url_to_repo',
+        'web_url',
+        'name',
+        'name_with_namespace',
+        'path',
+        'path_with_namespace',
+        'star_count',
+        'forks_count',
+        'created_at',
+        'last_activity_at',
+    ]
 
     ####
     # Extra Actions
@@ -170,6 +211,13 @@ class Project(APIDefinition):
             'author_email',
             'author_name'
         ]
+        @classmethod
+        def wrapper(cls, extra_action_fn, parent):
+            """Also accept a file object (or a path as source=...) as the
+               content, which is streamed base64 encoded
+            """
+            from gitlab3._streaming import stream_file_action
+            return stream_file_action(cls, extra_action_fn)
     class GetFileAction(ExtraActionDefinition):
         """gl.Project.get_file()"""
         url = '/repository/files'
@@ -178,21 +226,9 @@ class Project(APIDefinition):
             'file_path',
             'ref'
         ]
-    class UpdateFileAction(ExtraActionDefinition):
+    class UpdateFileAction(CreateFileAction):
         """gl.Project.update_file()"""
-        url = '/repository/files'
         method = _HTTP_PUT
-        required_params = [
-            'file_path',
-            'branch_name',
-            'content',
-            'commit_message',
-        ]
-        optional_params = [
-            'encoding',
-            'author_email',
-            'author_name'
-        ]
     class DeleteFileAction(ExtraActionDefinition):
         """gl.Project.delete_file()"""
         url = '/repository/files'
@@ -302,6 +338,8 @@ class Project(APIDefinition):
     class Event(APIDefinition):
         url = '/events'
         actions = [ _LIST ]
+        time_window_params = ( 'after', 'before' )
+        time_window_days = True
 
     class Hook(APIDefinition):
         url = '/hooks/:id'
@@ -336,6 +374,8 @@ class Project(APIDefinition):
             'labels',
             'state_event',
         ]
+        watch_params = { 'order_by': 'updated_at' }
+        find_params = { 'iid': 'iid', 'state': 'state', 'labels': 'labels' }
         sub_apis = [ Note ]
         class CloseAction(ExtraActionDefinition):
             """gl.Project.Issue.close()"""
@@ -398,6 +438,8 @@ class Project(APIDefinition):
             'title',
         ]
         optional_params = [ 'assignee_id' ]
+        watch_params = { 'order_by': 'updated_at' }
+        find_params = { 'iid': 'iid', 'state': 'state' }
 
         class PostCommentAction(ExtraActionDefinition):
             """gl.Project.MergeRequest.post_comment(note)"""
@@ -425,6 +467,7 @@ class Project(APIDefinition):
             'due_date',
             'state_event',
         ]
+        find_params = { 'iid': 'iid' }
 
     class Snippet(APIDefinition):
         url = '/snippets/:snippet_id'
@@ -467,6 +510,7 @@ class Project(APIDefinition):
         optional_params = [
             'ref_name',
         ]
+        time_window_params = ( 'since', 'until' )
         class DiffAction(ExtraActionDefinition):
             """gl.Project.Commit.diff()"""
             url = '/diff'
@@ -517,6 +561,8 @@ class Group(APIDefinition):
         'name',
         'path',
     ]
+    find_params = { 'name': 'search', 'path': 'search' }
+    find_query_params = [ 'search' ]
 
     ####
     # Extra Actions
@@ -563,6 +609,8 @@ class User(APIDefinition):
         'admin',
         'can_create_group',
     ]
+    find_params = { 'username': 'search', 'email': 'search', 'name': 'search' }
+    find_query_params = [ 'search' ]
 
     class SSHKey(SSHKey):
         actions = [ _LIST, _ADD, _DELETE ]
@@ -0,0 +1,103 @@
+"""
+Per-thread request context, e.g. the deadline of the high-level call a
+request belongs to. _WorkStealingPool captures the context when a task is
+submitted and restores it in the worker thread running the task.
+"""
+
+import threading
+import time
+
+_local = threading.local()
+
+
+def _values():
+    try:
+        return _local.values
+    except AttributeError:
+        _local.values = {}
+        return _local.values
+
+
+def get(name, default=None):
+    return _values().get(name, default)
+
+
+def capture():
+    """Return a copy of the current thread's context"""
+    return dict(_values())
+
+
+class _Scope(object):
+    """Context manager installing context values for a with block"""
+
+    def __init__(self, values, replace=False):
+        self.values = values
+        self.replace = replace
+
+    def __enter__(self):
+        self.saved = _values()
+        if self.replace:
+            _local.values = dict(self.values)
+        else:
+            values = dict(self.saved)
+            values.update(self.values)
+            _local.values = values
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _local.values = self.saved
+
+
+def scope(**values):
+    """Context manager adding values to the current context"""
+    return _Scope(values)
+
+
+def restore(values):
+    """Context manager replacing the context with a captured one"""
+    return _Scope(values, replace=True)
+
+
+def deadline(seconds):
+    """Context manager giving everything inside it 'seconds' to complete.
+       Nested deadlines can only shorten the time left, never extend it.
+       seconds=None leaves the current deadline in place.
+    """
+    if seconds is None:
+        return _Scope({})
+    return deadline_at(time.time() + seconds)
+
+
+def deadline_time(seconds=None):
+    """Absolute time.time() deadline of something given 'seconds' from
+       now, taking the current deadline into account (None if neither)
+    """
+    when = get('deadline')
+    if seconds is not None:
+        when = min(when or float('inf'), time.time() + seconds)
+    return when
+
+
+def deadline_at(when):
+    """Like deadline(), with an absolute time.time() value"""
+    current = get('deadline')
+    if when is None or (current is not None and current <= when):
+        return _Scope({})
+    return _Scope({'deadline': when})
+
+
+def priority(name):
+    """Context manager tagging requests with a priority class of the
+       RequestScheduler. name=None leaves the current priority in place.
+    """
+    if name is None:
+        return _Scope({})
+    return _Scope({'priority': name})
+
+
+def remaining():
+    """Seconds left until the current deadline, None if there is none"""
+    when = get('deadline')
+    if when is None:
+        return None
+    return when - time.time()
@@ -0,0 +1,158 @@
+"""
+Small thread pool shared by the concurrent helpers (walkers, bulk
+operations, prefetching).
+
+Each worker owns a deque of tasks. Tasks submitted from inside a worker
+go to that worker's own deque and are popped LIFO, which keeps a deep
+traversal close to the data it just fetched; idle workers steal from the
+opposite end of their siblings' deques. The number of workers is the
+global concurrency cap for everything run through the pool.
+"""
+
+import sys
+import threading
+from collections import deque
+
+from . import _context
+
+
+class _Task(object):
+    """Handle to the result of a function submitted to a pool"""
+
+    def __init__(self, fn, args, kwargs):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._context = _context.capture()  # e.g. the caller's deadline
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def _run(self):
+        try:
+            with _context.restore(self._context):
+                self._result = self._fn(*self._args, **self._kwargs)
+        except BaseException:
+            self._exc_info = sys.exc_info()
+        self._fn = self._args = self._kwargs = self._context = None
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """Block until the task has run; re-raise its exception if any"""
+        self._done.wait(timeout)
+        if self._exc_info:
+            exc = self._exc_info[1]
+            self._exc_info = None
+            raise exc
+        return self._result
+
+
+class _WorkStealingPool(object):
+    """Fixed-size pool of worker threads with per-worker task deques"""
+
+    def __init__(self, jobs=8):
+        if jobs < 1:
+            raise ValueError("jobs must be at least 1")
+        self._lock = threading.Condition(threading.Lock())
+        self._deques = [deque() for i in range(jobs)]
+        self._local = threading.local()
+        self._next = 0
+        self._pending = 0
+        self._shutdown = False
+        self._threads = []
+        for i in range(jobs):
+            t = threading.Thread(target=self._worker, args=(i,))
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.shutdown()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs); returns a _Task"""
+        task = _Task(fn, args, kwargs)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit to a pool that was shut down")
+            idx = getattr(self._local, 'idx', None)
+            if idx is None:  # submitted from outside: round-robin
+                idx = self._next
+                self._next = (self._next + 1) % len(self._deques)
+            self._deques[idx].append(task)
+            self._pending += 1
+            self._lock.notify()
+        return task
+
+    def map(self, fn, iterable):
+        """Like map(), but runs fn concurrently. Results keep input order."""
+        tasks = [self.submit(fn, item) for item in iterable]
+        return [task.result() for task in tasks]
+
+    def imap_unordered(self, fn, iterable):
+        """Yield fn(item) for every item as soon as each one completes"""
+        results = deque()
+        ready = threading.Condition(threading.Lock())
+        def run(item):
+            try:
+                value = (True, fn(item))
+            except BaseException:
+                value = (False, sys.exc_info()[1])
+            with ready:
+                results.append(value)
+                ready.notify()
+        count = 0
+        for item in iterable:
+            self.submit(run, item)
+            count += 1
+        for i in range(count):
+            with ready:
+                while not results:
+                    ready.wait()
+                ok, value = results.popleft()
+            if not ok:
+                raise value
+            yield value
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._shutdown = True
+            self._lock.notify_all()
+        if wait:
+            for t in self._threads:
+                if t is not threading.current_thread():
+                    t.join()
+
+    def _take(self, idx):
+        """Pop from our own deque, else steal from a sibling. Lock held."""
+        own = self._deques[idx]
+        if own:
+            return own.pop()
+        n = len(self._deques)
+        for i in range(1, n):
+            victim = self._deques[(idx + i) % n]
+            if victim:
+                return victim.popleft()
+        return None
+
+    def _worker(self, idx):
+        self._local.idx = idx
+        while True:
+            with self._lock:
+                task = self._take(idx)
+                while task is None:
+                    if self._shutdown:
+                        return
+                    self._lock.wait()
+                    task = self._take(idx)
+                self._pending -= 1
+            task._run()
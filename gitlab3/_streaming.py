@@ -0,0 +1,191 @@
+"""
+Helpers for streaming request and response bodies.
+"""
+
+import base64
+import codecs
+import json
+from collections import OrderedDict
+
+try:
+    from urllib import urlencode, quote
+except ImportError:
+    from urllib.parse import urlencode, quote
+
+from . import _context
+from ._pool import _WorkStealingPool
+
+# Bytes of the file read at a time; a multiple of 3 so that the base64
+# encodings of consecutive chunks can simply be concatenated
+_UPLOAD_CHUNK_SIZE = 3 * 16 * 1024
+
+
+def _form_body(fields, stream_field, fp, chunk_size=_UPLOAD_CHUNK_SIZE):
+    """Generate an application/x-www-form-urlencoded body consisting of
+       fields and stream_field, whose value is the base64 encoding of the
+       contents of fp. Only one chunk of the file is held at a time.
+    """
+    prefix = urlencode(sorted(fields.items()))
+    if prefix:
+        prefix += '&'
+    yield (prefix + stream_field + '=').encode('ascii')
+    carry = b''
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        if not isinstance(chunk, bytes):  # file opened in text mode
+            chunk = chunk.encode('utf-8')
+        chunk = carry + chunk
+        cut = len(chunk) - len(chunk) % 3
+        carry = chunk[cut:]
+        if cut:
+            yield quote(base64.b64encode(chunk[:cut])).encode('ascii')
+    if carry:
+        yield quote(base64.b64encode(carry)).encode('ascii')
+
+
+# Bytes of a streamed response read at a time
+_RESPONSE_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\r\n'
+_DELIMITERS = _WHITESPACE + ',]'
+
+
+def _iter_json_array(chunks):
+    """Yield the elements of a JSON array given as an iterable of byte
+       chunks, each as soon as it is complete. Only the element being
+       parsed is buffered. A body which is not an array is decoded at once
+       (and its items yielded if it is a list after all).
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    started = False
+    eof = False
+    retry_len = 0  # don't re-parse an incomplete element on every chunk
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos < len(buf):
+            c = buf[pos]
+            if not started:
+                if c != '[':
+                    rest = buf[pos:] + ''.join(utf8.decode(chunk)
+                                               for chunk in chunks)
+                    value = json.loads(rest + utf8.decode(b'', True))
+                    if not isinstance(value, list):
+                        raise ValueError("Expected a JSON array")
+                    for item in value:
+                        yield item
+                    return
+                started = True
+                pos += 1
+                continue
+            if c == ']':
+                return
+            if c == ',':
+                pos += 1
+                continue
+            if eof or len(buf) - pos >= 2 * retry_len:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    end = None
+                # A number may continue in the next chunk ('4500.' '0')
+                if end is not None and \
+                        (c in '{["' or eof or
+                         (end < len(buf) and buf[end] in _DELIMITERS)):
+                    yield value
+                    pos = end
+                    retry_len = 0
+                    continue
+                retry_len = len(buf) - pos
+        if eof:
+            raise ValueError("Truncated JSON array")
+        buf = buf[pos:]
+        pos = 0
+        try:
+            buf += utf8.decode(next(chunks))
+        except StopIteration:
+            buf += utf8.decode(b'', True)
+            eof = True
+
+
+def _is_stream(content):
+    return hasattr(content, 'read')
+
+
+def stream_file_action(action_def, extra_action_fn):
+    """Wrap create_file()/update_file() so that 'content' may also be a
+       file object, or the file may be given as a path with source=...
+       Such contents are sent base64 encoded in a streamed request body.
+    """
+    def wrapped(self, file_path, branch_name, content=None,
+                commit_message=None, source=None, **kwargs):
+        if commit_message is None:
+            raise TypeError("%s() requires a commit_message"
+                            % action_def.name())
+        if source is None and not _is_stream(content):
+            return extra_action_fn(self, file_path, branch_name, content,
+                                   commit_message, **kwargs)
+        fields = dict(kwargs)
+        fields['file_path'] = file_path
+        fields['branch_name'] = branch_name
+        fields['commit_message'] = commit_message
+        fields['encoding'] = 'base64'
+        import gitlab3
+        req_fn = gitlab3._get_http_request_fn(type(self), action_def.method)
+        url = self._q_url + action_def.url
+        if source is not None:
+            with open(source, 'rb') as fp:
+                return req_fn(self, url, data=_form_body(fields, 'content', fp))
+        return req_fn(self, url, data=_form_body(fields, 'content', content))
+    return wrapped
+
+
+def upload_files(self, files, branch_name, commit_message, update=False,
+                 jobs=4, deadline=None, priority=None, **kwargs):
+    """files: iterable of (file_path, source) or (file_path, source,
+       branch_name) tuples or a dict, where source is a local path or a
+       file object. Every file is uploaded with its own commit, to
+       branch_name unless given its own branch. GitLab serializes the
+       updates of a branch, so the commits to a branch are made one after
+       the other; only different branches are uploaded to concurrently,
+       up to 'jobs' at a time. Returns a list of (file_path, result)
+       pairs in input order; result is the exception for failed files,
+       e.g. DeadlineExceeded for those not uploaded within 'deadline'
+       seconds. 'priority' is the RequestScheduler priority class.
+    """
+    if isinstance(files, dict):
+        files = files.items()
+    upload = self.update_file if update else self.create_file
+    def run_one(item):
+        file_path, source = item[:2]
+        branch = item[2] if len(item) > 2 else branch_name
+        try:
+            if _is_stream(source):
+                ret = upload(file_path, branch, source,
+                             commit_message, **kwargs)
+            else:
+                ret = upload(file_path, branch,
+                             commit_message=commit_message, source=source,
+                             **kwargs)
+        except Exception as e:
+            ret = e
+        return file_path, ret
+    def run(indexed_items):
+        return [(i, run_one(item)) for i, item in indexed_items]
+    branches = OrderedDict()  # branch => [(index, item)]
+    for i, item in enumerate(files):
+        branch = item[2] if len(item) > 2 else branch_name
+        branches.setdefault(branch, []).append((i, item))
+    results = [None] * sum(len(items) for items in branches.values())
+    with _context.deadline(deadline), _context.priority(priority), \
+            _WorkStealingPool(jobs) as pool:
+        for done in pool.map(run, list(branches.values())):
+            for i, result in done:
+                results[i] = result
+    return results
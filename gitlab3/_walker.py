@@ -0,0 +1,279 @@
+"""
+Concurrent traversal of the resource tree, e.g. every note of every merge
+request of every project:
+
+    for path, note in gl.walk(['projects', 'merge_requests', 'notes']):
+        ...
+
+Listings are fetched on a _WorkStealingPool while results are streamed
+back to the caller as they arrive. All bookkeeping happens in the thread
+consuming the generator, so the worker threads only perform requests.
+"""
+
+import json
+import os
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import _context
+from . import exceptions
+from ._pool import _WorkStealingPool
+
+
+def _normalize_spec(spec):
+    """Turn ['projects', ('issues', {'state': 'opened'})] into a list of
+       (plural_name, params) tuples
+    """
+    ret = []
+    for level in spec:
+        if isinstance(level, (tuple, list)):
+            name, params = level
+        else:
+            name, params = level, {}
+        ret.append((name, dict(params)))
+    if not ret:
+        raise ValueError("walk() requires at least one level")
+    return ret
+
+
+def _next_result(results, when):
+    """results.get(), raising DeadlineExceeded once 'when' has passed"""
+    if when is None:
+        return results.get()
+    remaining = when - time.time()
+    try:
+        if remaining <= 0:
+            return results.get_nowait()
+        return results.get(timeout=remaining)
+    except queue.Empty:
+        raise exceptions.DeadlineExceeded("Deadline exceeded during walk")
+
+
+def _obj_key(obj, idx):
+    """Key identifying obj within its listing (its id, or its position
+       for objects GitLab gives no id, e.g. events)
+    """
+    if obj._id is not None:
+        return obj._id
+    return '#%d' % idx
+
+
+class _Node(object):
+    """A listed object whose subtree is still being walked"""
+
+    def __init__(self, obj, path, level, parent):
+        self.obj = obj
+        self.path = path
+        self.level = level
+        self.parent = parent
+        self.pending = 1  # our own listing
+
+
+class _Checkpoint(object):
+    """Append-only record of subtrees which have been walked completely"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = set()
+        self._fp = None
+        if filename and os.path.exists(filename):
+            with open(filename) as fp:
+                for line in fp:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        path = json.loads(line)
+                    except ValueError:  # partially written last line
+                        continue
+                    self.done.add(tuple(tuple(p) for p in path))
+
+    def __contains__(self, path):
+        return path in self.done
+
+    def add(self, path):
+        self.done.add(path)
+        if not self.filename:
+            return
+        if self._fp is None:
+            self._fp = open(self.filename, 'a')
+        self._fp.write(json.dumps(path) + '\n')
+        self._fp.flush()
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+def walk(root, spec, jobs=8, checkpoint=None, deadline=None, priority=None,
+         pool=None):
+    """Walk the resource tree below root according to spec, yielding
+       (path, object) tuples as they are fetched.
+
+       spec is a list of listing function names, one per level, each
+       optionally paired with query parameters. path is a tuple of
+       (listing name, key) pairs leading to the object.
+
+       At most 'jobs' requests are in flight at once. If 'checkpoint' names
+       a file, completed subtrees are recorded there and skipped when the
+       walk is started again with the same file, so an interrupted crawl
+       can be resumed. Objects of unfinished subtrees may be yielded again.
+
+       If the walk takes longer than 'deadline' seconds, DeadlineExceeded
+       is raised; everything yielded before that is complete. 'priority'
+       is the RequestScheduler priority class of the walk's requests.
+
+       'pool' is a _WorkStealingPool to run the requests on (shared with
+       other work of the caller) instead of a pool of 'jobs' workers.
+    """
+    spec = _normalize_spec(spec)
+    when = _context.deadline_time(deadline)
+    done = _Checkpoint(checkpoint)
+    results = queue.Queue()
+    own_pool = pool is None
+    if own_pool:
+        pool = _WorkStealingPool(jobs)
+
+    def list_children(node):
+        try:
+            name, params = spec[node.level]
+            with _context.deadline_at(when), _context.priority(priority):
+                children = getattr(node.obj, name)(**dict(params))
+            results.put((node, children, None))
+        except Exception as e:
+            results.put((node, None, e))
+
+    def finish(node):
+        while node is not None:
+            node.pending -= 1
+            if node.pending:
+                return
+            if node.path:
+                done.add(node.path)
+            node = node.parent
+
+    root_node = _Node(root, (), 0, None)
+    pool.submit(list_children, root_node)
+    try:
+        while root_node.pending:
+            node, children, exc = _next_result(results, when)
+            if exc is not None:
+                raise exc
+            name = spec[node.level][0]
+            for idx, child in enumerate(children):
+                path = node.path + ((name, _obj_key(child, idx)),)
+                if path in done:
+                    continue
+                yield path, child
+                level = node.level + 1
+                if level < len(spec):
+                    node.pending += 1
+                    child_node = _Node(child, path, level, node)
+                    pool.submit(list_children, child_node)
+                else:
+                    done.add(path)
+            finish(node)
+    finally:
+        if own_pool:
+            pool.shutdown(wait=False)
+        done.close()
+
+
+def _tree_honours_recursive(entries, path):
+    """Whether a /repository/tree listing requested with recursive=true
+       was actually listed recursively (older GitLab versions ignore the
+       parameter and do not include each entry's 'path')
+    """
+    if not all(getattr(entry, 'path', None) for entry in entries):
+        return False
+    if not any(entry.type == 'tree' for entry in entries):
+        return True  # nothing below this level either way
+    depth = path.count('/') + 2 if path else 2
+    return any(entry.path.count('/') + 1 >= depth for entry in entries)
+
+
+def walk_tree(self, ref_name=None, path='', jobs=8, recursive=True,
+              blobs=False, deadline=None, priority=None):
+    """Yield (path, entry) for every file and directory below path.
+       A server-side recursive listing is used where GitLab supports
+       it; otherwise directories are listed concurrently, at most
+       'jobs' at a time. With blobs=True the contents of files are
+       fetched in parallel too and set as entry.blob. DeadlineExceeded
+       is raised if the listing takes longer than 'deadline' seconds.
+       'priority' is the RequestScheduler priority class to use.
+    """
+    path = path.strip('/')
+    when = _context.deadline_time(deadline)
+    params = {}
+    if ref_name is not None:
+        params['ref_name'] = ref_name
+    results = queue.Queue()
+    pool = _WorkStealingPool(jobs)
+
+    def list_dir(dir_path, recursive=False):
+        try:
+            data = dict(params)
+            if dir_path:
+                data['path'] = dir_path
+            if recursive:
+                data['recursive'] = 'true'
+            with _context.deadline_at(when), _context.priority(priority):
+                entries = self.files(**data)
+            results.put(('dir', dir_path, entries))
+        except Exception as e:
+            results.put(('error', dir_path, e))
+
+    def fetch_blob(entry_path, entry):
+        try:
+            with _context.deadline_at(when), _context.priority(priority):
+                entry.blob = self.get_blob(ref_name or 'HEAD', entry_path)
+            results.put(('blob', entry_path, entry))
+        except Exception as e:
+            results.put(('error', entry_path, e))
+
+    try:
+        pending = 1
+        if recursive:
+            list_dir(path, recursive=True)
+            kind, dir_path, entries = _next_result(results, when)
+            if kind == 'error':
+                raise entries
+            if _tree_honours_recursive(entries, path):
+                pending = 0
+                for entry in entries:
+                    if blobs and entry.type == 'blob':
+                        pending += 1
+                        pool.submit(fetch_blob, entry.path, entry)
+                    else:
+                        yield entry.path, entry
+            else:
+                results.put((kind, dir_path, entries))
+        else:
+            pool.submit(list_dir, path)
+        while pending:
+            kind, dir_path, value = _next_result(results, when)
+            pending -= 1
+            if kind == 'error':
+                raise value
+            if kind == 'blob':
+                yield dir_path, value
+                continue
+            for entry in value:
+                entry_path = entry.name
+                if dir_path:
+                    entry_path = dir_path + '/' + entry.name
+                if entry.type == 'tree':
+                    pending += 1
+                    pool.submit(list_dir, entry_path)
+                elif blobs and entry.type == 'blob':
+                    pending += 1
+                    pool.submit(fetch_blob, entry_path, entry)
+                    continue
+                yield entry_path, entry
+    finally:
+        pool.shutdown(wait=False)
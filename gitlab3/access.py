@@ -0,0 +1,322 @@
+"""
+gitlab3.access
+~~~~~~~~~~~~~~
+
+In-memory index of effective access levels, in both directions (user =>
+projects, project => users). Group and project memberships are fetched
+concurrently; a member of a group has (at least) their group access level
+on every project of the group.
+
+    index = AccessIndex(gl).build()
+    index.can(user_id, project_id, gitlab3.ACCESS_LEVEL_DEVELOPER)
+    index.projects_of(user_id, min_level=gitlab3.ACCESS_LEVEL_DEVELOPER)
+    index.users_of(project_id)
+
+The index can be kept current from system hook events, or refreshed
+selectively:
+
+    receiver.subscribe('*', index.apply_event)
+    index.refresh(max_age=3600)  # re-fetch memberships older than an hour
+"""
+
+import threading
+import time
+
+from . import ACCESS_LEVEL_OWNER
+from . import exceptions
+from ._pool import _WorkStealingPool
+
+# Access level names used in system hook payloads
+_LEVEL_NAMES = {
+    'guest': 10,
+    'reporter': 20,
+    'developer': 30,
+    'master': 40,
+    'owner': 50,
+}
+
+
+def _level(value):
+    """Access level from a number or a name such as 'Master'"""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return _LEVEL_NAMES.get(value.lower())
+
+
+class AccessIndex(object):
+    """Effective access levels of users on projects"""
+
+    def __init__(self, gitlab, jobs=8):
+        self.gitlab = gitlab
+        self.jobs = jobs
+        self.projects = {}  # project id => Project
+        self.groups = {}  # group id => Group
+        self.usernames = {}  # username => user id
+        self._project_members = {}  # project id => {user id: level}
+        self._group_members = {}  # group id => {user id: level}
+        self._group_projects = {}  # group id => set of project ids
+        self._by_project = {}  # project id => {user id: effective level}
+        self._by_user = {}  # user id => {project id: effective level}
+        self._fetched = {}  # ('project'|'group', id) => time of last fetch
+        self._lock = threading.RLock()
+
+    # Queries
+
+    def level(self, user_id, project_id):
+        """Effective access level of a user on a project, 0 for none"""
+        return self._by_user.get(user_id, {}).get(project_id, 0)
+
+    def can(self, user_id, project_id, min_level):
+        """Whether a user has at least min_level on a project"""
+        return self.level(user_id, project_id) >= min_level
+
+    def projects_of(self, user_id, min_level=None):
+        """{project id: effective level} of the projects of a user"""
+        projects = self._by_user.get(user_id, {})
+        if min_level is None:
+            return dict(projects)
+        return dict((pid, lvl) for pid, lvl in projects.items()
+                    if lvl >= min_level)
+
+    def users_of(self, project_id, min_level=None):
+        """{user id: effective level} of the users of a project"""
+        users = self._by_project.get(project_id, {})
+        if min_level is None:
+            return dict(users)
+        return dict((uid, lvl) for uid, lvl in users.items()
+                    if lvl >= min_level)
+
+    def user_id(self, username):
+        """Id of a user seen as a member of something, or None"""
+        return self.usernames.get(username)
+
+    # Building
+
+    def build(self):
+        """(Re)build the index from scratch. Returns self."""
+        with self._lock:
+            self._fetched.clear()
+        return self.refresh(max_age=0)
+
+    def refresh(self, projects=None, groups=None, max_age=None):
+        """Bring the index up to date.
+
+           Given projects and/or groups (objects or ids), only their
+           memberships are fetched again. Otherwise the project and group
+           listings are fetched; removed ones are dropped, and memberships
+           are fetched for new ones and those fetched more than max_age
+           seconds ago (never, if max_age is None). Returns self.
+        """
+        if projects is not None or groups is not None:
+            todo = [('project', self._resolve('project', p))
+                    for p in projects or []]
+            todo += [('group', self._resolve('group', g))
+                     for g in groups or []]
+            self._fetch(todo)
+            return self
+
+        group_list = self.gitlab.groups()
+        project_list = self.gitlab.projects()
+        now = time.time()
+        with self._lock:
+            listed_groups = set(g._id for g in group_list)
+            listed_projects = set(p._id for p in project_list)
+            for gid in set(self.groups) - listed_groups:
+                self._drop_group(gid)
+            for pid in set(self.projects) - listed_projects:
+                self._drop_project(pid)
+            for group in group_list:  # projects need to know their groups
+                self.groups[group._id] = group
+            todo = []
+            for kind, objs in (('group', group_list),
+                               ('project', project_list)):
+                for obj in objs:
+                    fetched = self._fetched.get((kind, obj._id))
+                    if fetched is None or \
+                            (max_age is not None and now - fetched >= max_age):
+                        todo.append((kind, obj))
+                    elif kind == 'project':
+                        self._set_project(obj)
+        self._fetch(todo)
+        return self
+
+    def _resolve(self, kind, obj):
+        if hasattr(obj, '_get_keys'):  # not an id
+            return obj
+        if kind == 'project':
+            return self.gitlab.project(obj)
+        return self.gitlab.group(obj)
+
+    def _fetch(self, todo):
+        """Fetch the memberships of (kind, object) pairs concurrently,
+           applying each as it arrives
+        """
+        if not todo:
+            return
+        def fetch(item):
+            kind, obj = item
+            try:
+                return kind, obj, obj.members(), time.time()
+            except exceptions.ResourceNotFound:  # removed meanwhile
+                return kind, obj, None, time.time()
+        with _WorkStealingPool(min(self.jobs, len(todo))) as pool:
+            for kind, obj, members, fetched in pool.imap_unordered(fetch,
+                                                                   todo):
+                with self._lock:
+                    if members is not None:
+                        for member in members:
+                            username = getattr(member, 'username', None)
+                            if username:
+                                self.usernames[username] = member._id
+                        members = dict((member._id, member.access_level)
+                                       for member in members)
+                    if kind == 'group':
+                        self._apply_group(obj, members, fetched)
+                    else:
+                        self._apply_project(obj, members, fetched)
+
+    def _apply_group(self, group, members, fetched):
+        """Lock held"""
+        if members is None:
+            self._drop_group(group._id)
+            return
+        self.groups[group._id] = group
+        self._group_members[group._id] = members
+        self._fetched[('group', group._id)] = fetched
+        for pid in self._group_projects.get(group._id, ()):
+            self._recompute(pid)
+
+    def _apply_project(self, project, members, fetched):
+        """Lock held"""
+        if members is None:
+            self._drop_project(project._id)
+            return
+        self._project_members[project._id] = members
+        self._fetched[('project', project._id)] = fetched
+        self._set_project(project)
+
+    def _set_project(self, project):
+        """Record a project and its group, recomputing its levels. Lock
+           held.
+        """
+        pid = project._id
+        old = self.projects.get(pid)
+        if old is not None:
+            self._group_projects.get(self._group_id(old), set()).discard(pid)
+        self.projects[pid] = project
+        gid = self._group_id(project)
+        if gid is not None:
+            self._group_projects.setdefault(gid, set()).add(pid)
+        self._recompute(pid)
+
+    def _group_id(self, project):
+        namespace = getattr(project, 'namespace', None) or {}
+        gid = namespace.get('id')
+        if gid in self.groups or gid in self._group_projects:
+            return gid
+        return None  # a user's namespace
+
+    def _recompute(self, pid):
+        """Recompute the effective levels on a project. Lock held."""
+        project = self.projects.get(pid)
+        levels = dict(self._project_members.get(pid, {}))
+        if project is not None:
+            gid = self._group_id(project)
+            if gid is not None:
+                for uid, lvl in self._group_members.get(gid, {}).items():
+                    if lvl > levels.get(uid, 0):
+                        levels[uid] = lvl
+            else:
+                owner = getattr(project, 'owner', None) or {}
+                if owner.get('id') is not None:
+                    levels[owner['id']] = ACCESS_LEVEL_OWNER
+        old = self._by_project.get(pid, {})
+        for uid in set(old) - set(levels):
+            user_projects = self._by_user.get(uid)
+            if user_projects is not None:
+                user_projects.pop(pid, None)
+                if not user_projects:
+                    del self._by_user[uid]
+        for uid, lvl in levels.items():
+            self._by_user.setdefault(uid, {})[pid] = lvl
+        self._by_project[pid] = levels
+
+    def _drop_project(self, pid):
+        """Lock held"""
+        project = self.projects.pop(pid, None)
+        if project is not None:
+            self._group_projects.get(self._group_id(project),
+                                     set()).discard(pid)
+        self._project_members.pop(pid, None)
+        self._fetched.pop(('project', pid), None)
+        self._recompute(pid)
+        self._by_project.pop(pid, None)
+
+    def _drop_group(self, gid):
+        """Lock held"""
+        self.groups.pop(gid, None)
+        self._group_members.pop(gid, None)
+        self._fetched.pop(('group', gid), None)
+        for pid in self._group_projects.pop(gid, set()):
+            self._recompute(pid)
+
+    # System hook events
+
+    def apply_event(self, event):
+        """Update the index from a gitlab3.receiver.HookEvent; meant to
+           be subscribed to a HookReceiver's system hook events
+        """
+        name = event.name
+        data = event.payload
+        user_id = data.get('user_id')
+        username = data.get('user_username')
+        if username and user_id is not None:
+            self.usernames[username] = user_id
+        refresh = {}
+        with self._lock:
+            if name == 'user_add_to_team':
+                lvl = _level(data.get('access_level') or
+                             data.get('project_access'))
+                pid = data['project_id']
+                if lvl is None or pid not in self.projects:
+                    refresh['projects'] = [pid]
+                else:
+                    self._project_members.setdefault(pid, {})[user_id] = lvl
+                    self._recompute(pid)
+            elif name == 'user_remove_from_team':
+                pid = data['project_id']
+                self._project_members.get(pid, {}).pop(user_id, None)
+                self._recompute(pid)
+            elif name == 'user_add_to_group':
+                lvl = _level(data.get('access_level') or
+                             data.get('group_access'))
+                gid = data['group_id']
+                if lvl is None or gid not in self.groups:
+                    refresh['groups'] = [gid]
+                else:
+                    self._group_members.setdefault(gid, {})[user_id] = lvl
+                    for pid in self._group_projects.get(gid, ()):
+                        self._recompute(pid)
+            elif name == 'user_remove_from_group':
+                gid = data['group_id']
+                self._group_members.get(gid, {}).pop(user_id, None)
+                for pid in self._group_projects.get(gid, ()):
+                    self._recompute(pid)
+            elif name == 'user_destroy':
+                for members in list(self._project_members.values()) + \
+                               list(self._group_members.values()):
+                    members.pop(user_id, None)
+                for pid in list(self._by_user.get(user_id, {})):
+                    self._recompute(pid)
+            elif name == 'project_destroy':
+                self._drop_project(data['project_id'])
+            elif name == 'group_destroy':
+                self._drop_group(data.get('group_id', data.get('id')))
+            elif name in ('project_create', 'project_rename',
+                          'project_transfer'):
+                refresh['projects'] = [data['project_id']]
+        if refresh:  # outside the lock: this makes requests
+            self.refresh(**refresh)
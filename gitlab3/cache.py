@@ -0,0 +1,185 @@
+"""
+gitlab3.cache
+~~~~~~~~~~~~~
+
+Permanent cache for responses which can never change: those of requests
+addressing a commit by its full SHA (get_commit(sha), <commit>.diff(),
+get_blob(sha, path)). Requests by branch or tag name are never cached.
+Responses are only served to the identity (access token and sudo user)
+they were fetched with, as another user may not be allowed to see them.
+
+    gl = gitlab3.GitLab('http://example.com/', 'token',
+                        sha_cache=ShaCache(directory='~/.cache/gitlab3'))
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+# URLs whose responses are immutable once the commit is given by full SHA
+_IMMUTABLE_URL_RE = re.compile(
+    r'/repository/commits/(?:[0-9a-f]{40}|[0-9a-f]{64})(?:/diff|/blob)?'
+    r'(?:\?|$)')
+
+
+def is_immutable(url):
+    """Whether the response to a GET of url can be cached forever"""
+    return _IMMUTABLE_URL_RE.search(url) is not None
+
+
+class ShaCache(object):
+    """Size bounded LRU cache of immutable responses, in memory and
+       optionally on disk. No entry is ever revalidated.
+    """
+
+    def __init__(self, max_memory=64 * 1024 * 1024, directory=None,
+                 max_disk=1024 * 1024 * 1024):
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.directory = None
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key => content, least recent first
+        self._memory_size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        if directory:
+            self.directory = os.path.expanduser(directory)
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            for name in os.listdir(self.directory):
+                try:
+                    self._disk_size += os.path.getsize(self._path(name))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _key(url, identity):
+        key = hashlib.sha256(url.encode('utf-8'))
+        key.update(b'\0' + identity.encode('utf-8'))
+        return key.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, url, identity=''):
+        """Return the cached response body for url, fetched by identity,
+           or None
+        """
+        if not is_immutable(url):
+            return None
+        key = self._key(url, identity)
+        with self._lock:
+            content = self._memory.pop(key, None)
+            if content is not None:
+                self._memory[key] = content  # most recently used
+                self.hits += 1
+                return content
+        content = self._disk_get(key)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory_put(key, content)
+        return content
+
+    def put(self, url, content, identity=''):
+        """Store the response body of url, fetched by identity, if it is
+           immutable
+        """
+        if not is_immutable(url) or content is None:
+            return
+        key = self._key(url, identity)
+        with self._lock:
+            self._memory_put(key, content)
+        self._disk_put(key, content)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            if self.directory:
+                for name in os.listdir(self.directory):
+                    try:
+                        os.remove(self._path(name))
+                    except OSError:
+                        pass
+                self._disk_size = 0
+
+    def _memory_put(self, key, content):
+        """Insert into the memory LRU. Lock held."""
+        if len(content) > self.max_memory:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = content
+        self._memory_size += len(content)
+        while self._memory_size > self.max_memory:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _disk_get(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                content = fp.read()
+            os.utime(path, None)  # mtime orders eviction
+        except (IOError, OSError):
+            return None
+        return content
+
+    def _disk_put(self, key, content):
+        if not self.directory or len(content) > self.max_disk:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(content)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._disk_size += len(content)
+            if self._disk_size > self.max_disk:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        """Remove least recently used files until under max_disk (and a
+           tenth below it, so eviction does not run on every put). Lock
+           held.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp'):
+                continue
+            path = self._path(name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        self._disk_size = sum(size for mtime, size, path in entries)
+        target = self.max_disk * 0.9
+        for mtime, size, path in entries:
+            if self._disk_size <= target:
+                break
+            try:
+                os.remove(path)
+                self._disk_size -= size
+            except OSError:
+                pass
@@ -36,7 +36,31 @@ class ServerError(GitLabException):  # 500 Server Error
 class Unprocessable(GitLabException):  # 422 Unprocessable
     pass
 
+class TooManyRequests(GitLabException):  # 429 Too Many Requests
+    """The rate limit of the token (or of every token of the TokenPool)
+       was exceeded
+    """
+
 class ConnectionError(GitLabException):
     """A connection to GitLab could not be established due to a
        network problem, e.g. DNS failure, network is down, etc.
     """
+
+class RequestTimeout(ConnectionError):
+    """GitLab did not accept the connection or respond within the
+       connect_timeout/read_timeout given to GitLab()
+    """
+
+class DeadlineExceeded(RequestTimeout):
+    """The deadline of a high-level call passed before it completed.
+       'partial' holds the results gathered until then, where the call
+       returns a list.
+    """
+    def __init__(self, msg='', partial=None):
+        super(DeadlineExceeded, self).__init__(msg)
+        self.partial = partial
+
+class CircuitOpen(ConnectionError):
+    """Recent requests to the GitLab host failed too often, so the request
+       was not sent (see gitlab3.resilience.CircuitBreaker)
+    """
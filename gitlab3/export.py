@@ -0,0 +1,132 @@
+"""
+gitlab3.export
+~~~~~~~~~~~~~~
+
+Streaming export of listings to NDJSON or CSV. Pages are written as they
+arrive, straight from the decoded JSON, without building resource objects:
+
+    from gitlab3 import export
+
+    with open('projects.csv', 'w') as fp:
+        export.to_csv(gl.projects, fp,
+                      columns=['id', 'name', 'owner.name', 'created_at'],
+                      normalize_dates=True)
+"""
+
+import csv
+import json
+from datetime import timedelta
+
+from . import _GitLabAPI, _query_pages
+
+
+def _flatten(obj, prefix=''):
+    """{'owner': {'name': 'x'}} => {'owner.name': 'x'}"""
+    ret = {}
+    for key, val in obj.items():
+        key = prefix + key
+        if isinstance(val, dict) and val:
+            ret.update(_flatten(val, key + '.'))
+        else:
+            ret[key] = val
+    return ret
+
+
+def _normalize_date(val):
+    """GitLab date string => ISO 8601 string in UTC"""
+    dt = _GitLabAPI._convert_gitlab_date(val)
+    offset = dt.utcoffset()
+    if offset is None:
+        return dt.isoformat()
+    dt = (dt - offset).replace(tzinfo=None)
+    return dt.isoformat() + 'Z'
+
+
+def _normalize_dates(obj):
+    if isinstance(obj, list):
+        return [_normalize_dates(item) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    ret = {}
+    for key, val in obj.items():
+        if _GitLabAPI._date_fields.get(key) and val:
+            try:
+                val = _normalize_date(val)
+            except ValueError:  # leave unknown formats untouched
+                pass
+        elif isinstance(val, (dict, list)):
+            val = _normalize_dates(val)
+        ret[key] = val
+    return ret
+
+
+def _select(obj, columns):
+    """Pick (possibly dotted) columns out of a flattened or nested object"""
+    ret = {}
+    for column in columns:
+        if column in obj:
+            ret[column] = obj[column]
+            continue
+        val = obj
+        for part in column.split('.'):
+            if not isinstance(val, dict):
+                val = None
+                break
+            val = val.get(part)
+        ret[column] = val
+    return ret
+
+
+def iter_rows(listing, columns=None, flatten=False, normalize_dates=False,
+              **data):
+    """Yield the raw dicts of a listing function's entire listing (e.g.
+       gl.projects or project.issues), transformed as requested, page by
+       page. Extra keyword arguments are passed as query parameters.
+    """
+    for objs, hdrs in _query_pages(listing._api, listing._parent, data):
+        for obj in objs:
+            if normalize_dates:
+                obj = _normalize_dates(obj)
+            if flatten:
+                obj = _flatten(obj)
+            if columns:
+                obj = _select(obj, columns)
+            yield obj
+
+
+def to_ndjson(listing, fp, columns=None, flatten=False, normalize_dates=False,
+              **data):
+    """Write a listing to fp as newline-delimited JSON. Returns the number
+       of objects written.
+    """
+    count = 0
+    for obj in iter_rows(listing, columns, flatten, normalize_dates, **data):
+        fp.write(json.dumps(obj) + '\n')
+        count += 1
+    return count
+
+
+def _csv_value(val):
+    if isinstance(val, (dict, list)):
+        return json.dumps(val)
+    if val is None:
+        return ''
+    return val
+
+
+def to_csv(listing, fp, columns=None, normalize_dates=False, **data):
+    """Write a listing to fp as CSV, flattening nested objects into dotted
+       column names ('owner.name'). Without 'columns' the columns of the
+       first object are used. Returns the number of objects written.
+    """
+    writer = None
+    count = 0
+    for obj in iter_rows(listing, None, True, normalize_dates, **data):
+        if writer is None:
+            fieldnames = columns or list(obj.keys())
+            writer = csv.DictWriter(fp, fieldnames, extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow(dict((key, _csv_value(val)) for key, val
+                             in _select(obj, writer.fieldnames).items()))
+        count += 1
+    return count
@@ -0,0 +1,444 @@
+"""
+gitlab3.loadtest
+~~~~~~~~~~~~~~~~
+
+Record the requests a connection sends (with their responses), then
+replay them through the whole client stack against a local stub server
+serving the recorded responses, at a chosen concurrency and request rate:
+
+    gl = gitlab3.GitLab('http://example.com/', 'token',
+                        recorder=Recorder('traffic.ndjson'))
+    ...  # real work
+    gl.recorder.close()
+
+    report = replay('traffic.ndjson', concurrency=32, rate=200, repeat=5,
+                    hedging=True, metrics=True)  # GitLab() options
+    print report.render()
+
+The report gives the throughput, latency percentiles (overall and per URL
+template; with a rate, measured from the time each request was due to
+start, so that requests queued in the client count), how late requests
+started compared to the rate asked for, errors, client CPU time per request, the number of times the
+HTTP connection pool was full, and the memory (RSS) of the process over
+time. The stub server runs in a process of its own, so it does not count
+towards the CPU time of the client.
+
+Streamed responses (stream=True listings) are not recorded. Replaying
+configures the (class-wide) connection settings like creating any GitLab
+object does, so do not replay in a process using a real connection.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+try:
+    from urllib.parse import urlsplit, parse_qsl
+except ImportError:
+    from urlparse import urlsplit, parse_qsl
+
+from . import exceptions
+from ._pool import _WorkStealingPool
+
+# Response headers kept in recordings
+RECORDED_HEADERS = ('Content-Type', 'X-Page', 'X-Next-Page', 'X-Prev-Page',
+                    'X-Per-Page', 'X-Total', 'X-Total-Pages', 'Link',
+                    'ETag', 'RateLimit-Limit', 'RateLimit-Remaining',
+                    'RateLimit-Reset', 'Retry-After')
+
+try:
+    _cpu_time = time.process_time
+except AttributeError:  # Python 2
+    _cpu_time = time.clock
+
+
+class Recorder(object):
+    """Append the requests sent by a connection, with their responses,
+       to an NDJSON file (one request per line). Thread-safe.
+    """
+
+    def __init__(self, filename, headers=RECORDED_HEADERS):
+        self.filename = filename
+        self.headers = headers
+        self.count = 0
+        self._fp = open(filename, 'a')
+        self._start = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, method, template, path, data, response, elapsed):
+        """Record a request to path (relative to the API base URL, with
+           its query string) and its requests.Response
+        """
+        entry = {
+            't': round(time.time() - elapsed - self._start, 6),
+            'method': method.upper(),
+            'template': template,
+            'path': path,
+            'data': data if isinstance(data, dict) else None,
+            'status': response.status_code,
+            'headers': dict((name, response.headers[name])
+                            for name in self.headers
+                            if name in response.headers),
+            'body': response.text,
+            'elapsed': round(elapsed, 6),
+        }
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self._lock:
+            self._fp.write(line)
+            self._fp.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+
+def load(filename):
+    """The entries of a recording, in the order they were recorded"""
+    entries = []
+    with open(filename) as fp:
+        for line in fp:
+            if line.strip():
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry['t'])
+    return entries
+
+
+def _request_key(method, path, data):
+    """Key matching a replayed request to recorded responses"""
+    parts = urlsplit(path)
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    if isinstance(data, dict):
+        query += sorted((str(k), str(v)) for k, v in data.items())
+    return (method, parts.path, tuple(query))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body are written apart
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        prefix = self.server.prefix
+        path = self.path[len(prefix):] if self.path.startswith(prefix) \
+            else self.path
+        data = dict(parse_qsl(body, keep_blank_values=True)) \
+            if body else None
+        responses = self.server.responses.get(
+            _request_key(self.command, path, data))
+        if not responses:
+            entry = {'status': 404, 'headers': {}, 'body': '{}',
+                     'elapsed': 0}
+        else:
+            with self.server.lock:  # cycle through the recorded responses
+                entry = responses[0]
+                responses.rotate(-1)
+        latency = self.server.latency
+        if latency is None:
+            latency = entry['elapsed']
+        if latency:
+            time.sleep(latency)
+        content = entry['body'].encode('utf-8')
+        self.send_response(entry['status'])
+        for name, value in entry['headers'].items():
+            if name.lower() != 'content-length':
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+
+def _serve(filename, latency, conn):
+    """Stub server process: serve the responses of a recording"""
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _ReplayHandler)
+    server.prefix = '/api/v3'
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.responses = {}
+    for entry in load(filename):
+        key = _request_key(entry['method'], entry['path'], entry['data'])
+        server.responses.setdefault(key, deque()).append(entry)
+    conn.send(server.server_address[1])
+    conn.close()
+    server.serve_forever()
+
+
+class ReplayServer(object):
+    """Local HTTP server (in a process of its own) answering requests
+       with the responses of a recording, after the recorded latency or
+       'latency' seconds
+    """
+
+    def __init__(self, filename, latency=None):
+        self.filename = filename
+        self.latency = latency
+        self.url = None
+        self._process = None
+
+    def start(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self.filename, self.latency, child_conn))
+        self._process.daemon = True
+        self._process.start()
+        self.url = 'http://127.0.0.1:%d' % parent_conn.recv()
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+
+def _rss():
+    """Resident memory of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        import resource  # peak rather than current, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(round(q * (len(sorted_values) - 1)))]
+
+
+class _PoolFullCounter(logging.Handler):
+    """Count urllib3's 'Connection pool is full' warnings"""
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        if 'pool is full' in record.getMessage():
+            self.count += 1
+
+
+class LoadReport(object):
+    """Results of a replay()"""
+
+    def __init__(self, duration, latencies, errors, cpu_seconds,
+                 memory, pool_full, rate=None, start_lags=None):
+        self.duration = duration
+        self.latencies = latencies  # [(template, seconds)]
+        self.rate = rate  # requests per second asked for (open loop)
+        # Seconds each request started after it was due (open loop)
+        self.start_lags = start_lags or []
+        self.errors = errors  # exception class name => count
+        self.cpu_seconds = cpu_seconds
+        self.memory = memory  # [(seconds, RSS bytes, requests done)]
+        self.pool_full = pool_full
+        self.requests = len(latencies)
+
+    @property
+    def throughput(self):
+        """Requests per second"""
+        return self.requests / self.duration if self.duration else 0.0
+
+    @property
+    def rate_lag(self):
+        """Requests per second short of the rate asked for (open loop)"""
+        if self.rate is None:
+            return None
+        return max(0.0, self.rate - self.throughput)
+
+    def start_lag_percentiles(self, qs=(0.5, 0.9, 0.99)):
+        """{q: seconds} requests started after they were due (open
+           loop); q=1.0 is the maximum
+        """
+        values = sorted(self.start_lags)
+        return dict((q, _percentile(values, q)) for q in tuple(qs) + (1.0,))
+
+    @property
+    def cpu_per_request(self):
+        """Client CPU seconds per request"""
+        return self.cpu_seconds / self.requests if self.requests else 0.0
+
+    def percentiles(self, template=None, qs=(0.5, 0.9, 0.99)):
+        """{q: latency} overall, or for one URL template; q=1.0 is the
+           maximum
+        """
+        values = sorted(seconds for t, seconds in self.latencies
+                        if template is None or t == template)
+        return dict((q, _percentile(values, q)) for q in tuple(qs) + (1.0,))
+
+    def to_dict(self):
+        templates = sorted(set(t for t, seconds in self.latencies))
+        return {
+            'requests': self.requests,
+            'duration': self.duration,
+            'throughput': self.throughput,
+            'rate': self.rate,
+            'rate_lag': self.rate_lag,
+            'start_lag': self.start_lag_percentiles()
+                         if self.rate is not None else None,
+            'errors': dict(self.errors),
+            'cpu_per_request': self.cpu_per_request,
+            'pool_full': self.pool_full,
+            'latency': self.percentiles(),
+            'templates': dict((t, {
+                'requests': sum(1 for u, s in self.latencies if u == t),
+                'latency': self.percentiles(t),
+            }) for t in templates),
+            'memory': list(self.memory),
+        }
+
+    def render(self):
+        """Human readable report"""
+        lines = []
+        p = self.percentiles()
+        lines.append('%d requests in %.2fs (%.1f/s), %d errors'
+                     % (self.requests, self.duration, self.throughput,
+                        sum(self.errors.values())))
+        lines.append('latency: p50 %.4fs p90 %.4fs p99 %.4fs max %.4fs'
+                     % (p[0.5], p[0.9], p[0.99], p[1.0]))
+        if self.rate is not None:
+            lag = self.start_lag_percentiles()
+            lines.append('rate: %.1f/s asked for, %.1f/s achieved; started '
+                         'late by p50 %.4fs p99 %.4fs max %.4fs'
+                         % (self.rate, self.throughput, lag[0.5], lag[0.99],
+                            lag[1.0]))
+        lines.append('client CPU: %.2fms per request'
+                     % (self.cpu_per_request * 1000))
+        if self.pool_full:
+            lines.append('connection pool full %d times (raise the pool '
+                         'size or lower the concurrency)' % self.pool_full)
+        for name, count in sorted(self.errors.items()):
+            lines.append('  %s: %d' % (name, count))
+        if self.memory:
+            peak = max(rss for t, rss, done in self.memory)
+            lines.append('memory: %.1f MiB at start, %.1f MiB at end, '
+                         '%.1f MiB peak'
+                         % (self.memory[0][1] / 1048576.0,
+                            self.memory[-1][1] / 1048576.0,
+                            peak / 1048576.0))
+        lines.append('per URL template:')
+        for t in sorted(set(t for t, seconds in self.latencies)):
+            p = self.percentiles(t)
+            count = sum(1 for u, s in self.latencies if u == t)
+            lines.append('  %6d  p50 %.4fs p99 %.4fs  %s'
+                         % (count, p[0.5], p[0.99], t))
+        return '\n'.join(lines)
+
+
+def replay(filename, concurrency=8, rate=None, repeat=1, latency=None,
+           sample_interval=0.5, **gitlab_kwargs):
+    """Replay a recording through a GitLab connection (created with
+       gitlab_kwargs) against a ReplayServer, with 'concurrency' requests
+       in flight, or (open loop) starting 'rate' requests per second
+       (latencies are then measured from when a request was due, so
+       the time spent queued in the client counts). latency: seconds the server takes to answer, by default the
+       recorded ones. Returns a LoadReport.
+    """
+    from . import GitLab  # gitlab3 imports this module
+    entries = load(filename) * repeat
+    latencies = []
+    start_lags = []
+    errors = {}
+    memory = []
+    lock = threading.Lock()
+    counter = _PoolFullCounter()
+    loggers = [logging.getLogger(name) for name in
+               ('urllib3.connectionpool',
+                'requests.packages.urllib3.connectionpool')]
+    for logger in loggers:
+        logger.addHandler(counter)
+    server = ReplayServer(filename, latency).start()
+    try:
+        gl = GitLab(server.url, 'replay', **gitlab_kwargs)
+        slots = threading.Semaphore(concurrency)
+        finished = threading.Event()
+
+        def run(entry, due=None):
+            method = entry['method'].lower()
+            parts = urlsplit(entry['path'])
+            data = entry['data']
+            if method in ('get', 'head'):
+                data = parse_qsl(parts.query, keep_blank_values=True)
+            start = time.time()
+            if due is not None:
+                with lock:
+                    start_lags.append(max(0.0, start - due))
+                start = due  # avoid coordinated omission
+            try:
+                gl._request(method, parts.path, [], data)
+            except exceptions.GitLabException as e:
+                if entry['status'] < 400:  # recorded errors are expected
+                    with lock:
+                        name = type(e).__name__
+                        errors[name] = errors.get(name, 0) + 1
+            finally:
+                elapsed = time.time() - start
+                with lock:
+                    latencies.append((entry['template'], elapsed))
+                if rate is None:
+                    slots.release()
+
+        def sample():
+            while True:
+                with lock:
+                    done = len(latencies)
+                memory.append((time.time() - begin, _rss(), done))
+                if finished.wait(sample_interval):
+                    return
+
+        begin = time.time()
+        cpu = _cpu_time()
+        sampler = threading.Thread(target=sample)
+        sampler.daemon = True
+        sampler.start()
+        with _WorkStealingPool(concurrency) as pool:
+            for i, entry in enumerate(entries):
+                if rate is None:
+                    slots.acquire()
+                    pool.submit(run, entry)
+                else:
+                    due = begin + i / float(rate)
+                    delay = due - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                    pool.submit(run, entry, due)
+        duration = time.time() - begin
+        cpu = _cpu_time() - cpu
+        finished.set()
+        sampler.join()
+        memory.append((duration, _rss(), len(latencies)))
+    finally:
+        server.stop()
+        for logger in loggers:
+            logger.removeHandler(counter)
+    return LoadReport(duration, latencies, errors, cpu, memory,
+                      counter.count, rate, start_lags)
@@ -0,0 +1,242 @@
+"""
+gitlab3.metrics
+~~~~~~~~~~~~~~~
+
+Client-side request metrics: latency histograms, request and byte
+counters per URL template and method, in-flight gauges, error and retry
+counters and a log of slow requests.
+
+    gl = gitlab3.GitLab('http://example.com/', 'token', metrics=True)
+    ...
+    print gl.metrics.render()     # Prometheus text exposition format
+    gl.metrics.snapshot()         # the same numbers as a dict
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger('gitlab3.metrics')
+
+# Latency histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+
+class _Series(object):
+    """Numbers kept for one (method, URL template) pair"""
+
+    def __init__(self, buckets):
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.in_flight = 0
+        self.retries = 0
+        self.errors = {}  # exception class name => count
+        self.bucket_counts = [0] * len(buckets)
+        self.latency_sum = 0.0
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return 0  # streamed bodies are not measured
+
+
+class _Tracker(object):
+    """Context manager measuring one request"""
+
+    def __init__(self, registry, method, template):
+        self.registry = registry
+        self.method = method
+        self.template = template
+        self.response = None
+        self.url = None
+
+    def __enter__(self):
+        self.registry._started(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        elapsed = time.time() - self.start
+        self.registry._finished(self, elapsed, value)
+
+
+class MetricsRegistry(object):
+    """Thread-safe registry of request metrics"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, slow_threshold=None,
+                 slow_log_size=100, prefix='gitlab3'):
+        self.buckets = tuple(sorted(buckets))
+        self.slow_threshold = slow_threshold
+        self.slow_requests = deque(maxlen=slow_log_size)
+        self.prefix = prefix
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, method, template):
+        key = (method, template)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(self.buckets)
+        return series
+
+    def track(self, method, template):
+        """Return a context manager measuring one request to template"""
+        return _Tracker(self, method.upper(), template)
+
+    def record_retry(self, method, template):
+        """Count a repeated attempt (retry or hedge) of a request"""
+        with self._lock:
+            self._get_series(method.upper(), template).retries += 1
+
+    def _started(self, tracker):
+        with self._lock:
+            self._get_series(tracker.method, tracker.template).in_flight += 1
+
+    def _finished(self, tracker, elapsed, exc):
+        r = tracker.response
+        with self._lock:
+            series = self._get_series(tracker.method, tracker.template)
+            series.in_flight -= 1
+            series.requests += 1
+            series.latency_sum += elapsed
+            for i, bound in enumerate(self.buckets):
+                if elapsed <= bound:
+                    series.bucket_counts[i] += 1
+                    break
+            if r is not None:
+                series.bytes_sent += _body_size(getattr(r.request, 'body',
+                                                        None))
+                if r.headers.get('content-length'):
+                    series.bytes_received += int(r.headers['content-length'])
+                elif r._content_consumed:
+                    series.bytes_received += len(r.content or b'')
+            if exc is not None:
+                name = type(exc).__name__
+                series.errors[name] = series.errors.get(name, 0) + 1
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            entry = {
+                'method': tracker.method,
+                'template': tracker.template,
+                'url': tracker.url,
+                'seconds': elapsed,
+                'status': getattr(r, 'status_code', None),
+                'time': time.time(),
+            }
+            self.slow_requests.append(entry)
+            log.warning("slow request: %s %s took %.3fs",
+                        tracker.method, tracker.url or tracker.template,
+                        elapsed)
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self.slow_requests.clear()
+
+    def snapshot(self):
+        """Return all metrics as a dict keyed by (method, URL template)"""
+        ret = {}
+        with self._lock:
+            for key, series in self._series.items():
+                histogram = []
+                cumulative = 0
+                for bound, count in zip(self.buckets, series.bucket_counts):
+                    cumulative += count
+                    histogram.append((bound, cumulative))
+                ret[key] = {
+                    'requests': series.requests,
+                    'bytes_sent': series.bytes_sent,
+                    'bytes_received': series.bytes_received,
+                    'in_flight': series.in_flight,
+                    'retries': series.retries,
+                    'errors': dict(series.errors),
+                    'latency_sum': series.latency_sum,
+                    'latency_buckets': histogram,
+                }
+        return ret
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        p = self.prefix
+        snapshot = self.snapshot()
+        lines = []
+        def family(name, kind, help_text):
+            lines.append('# HELP %s_%s %s' % (p, name, help_text))
+            lines.append('# TYPE %s_%s %s' % (p, name, kind))
+        def sample(name, labels, value):
+            lines.append('%s_%s{%s} %s' % (p, name, _labels(labels),
+                                           _number(value)))
+        keys = sorted(snapshot)
+
+        family('requests_total', 'counter', 'Requests sent to GitLab.')
+        for method, url in keys:
+            sample('requests_total', [('method', method), ('url', url)],
+                   snapshot[(method, url)]['requests'])
+        family('request_bytes_total', 'counter',
+               'Request and response body bytes.')
+        for method, url in keys:
+            s = snapshot[(method, url)]
+            for direction in ('sent', 'received'):
+                sample('request_bytes_total',
+                       [('method', method), ('url', url),
+                        ('direction', direction)],
+                       s['bytes_' + direction])
+        family('requests_in_flight', 'gauge', 'Requests awaiting a response.')
+        for method, url in keys:
+            sample('requests_in_flight', [('method', method), ('url', url)],
+                   snapshot[(method, url)]['in_flight'])
+        family('request_retries_total', 'counter',
+               'Repeated attempts of requests.')
+        for method, url in keys:
+            sample('request_retries_total', [('method', method), ('url', url)],
+                   snapshot[(method, url)]['retries'])
+        family('request_errors_total', 'counter',
+               'Failed requests by exception class.')
+        for method, url in keys:
+            errors = snapshot[(method, url)]['errors']
+            for exc in sorted(errors):
+                sample('request_errors_total',
+                       [('method', method), ('url', url), ('exception', exc)],
+                       errors[exc])
+        family('request_duration_seconds', 'histogram',
+               'Request latency in seconds.')
+        for method, url in keys:
+            s = snapshot[(method, url)]
+            labels = [('method', method), ('url', url)]
+            for bound, count in s['latency_buckets']:
+                sample('request_duration_seconds_bucket',
+                       labels + [('le', _number(bound))], count)
+            sample('request_duration_seconds_bucket', labels + [('le', '+Inf')],
+                   s['requests'])
+            sample('request_duration_seconds_sum', labels, s['latency_sum'])
+            sample('request_duration_seconds_count', labels, s['requests'])
+        return '\n'.join(lines) + '\n'
+
+    def __call__(self, environ, start_response):
+        """WSGI application serving render(), for scraping"""
+        body = self.render().encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+        ])
+        return [body]
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _labels(labels):
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"') \
+                          .replace('\n', '\\n')
+        parts.append('%s="%s"' % (name, value))
+    return ','.join(parts)
@@ -0,0 +1,349 @@
+"""
+gitlab3.receiver
+~~~~~~~~~~~~~~~~
+
+Receiver for GitLab project web hooks and system hooks. Hook payloads are
+validated and converted into the library's resource objects, kept in a
+small resource cache and handed to subscribed callbacks, which makes it
+possible to react to changes without polling.
+
+    receiver = HookReceiver(gl, secret_token='s3cret')
+
+    @receiver.subscribe('merge_request')
+    def on_merge_request(event):
+        print event.object.title, event.object.state
+
+    receiver.serve('0.0.0.0', 8000)  # or mount 'receiver' as a WSGI app
+"""
+
+import hmac
+import json
+import logging
+import re
+import threading
+
+log = logging.getLogger('gitlab3.receiver')
+
+
+class InvalidHookPayload(ValueError):
+    """The request body is not a GitLab hook payload"""
+
+
+class InvalidHookToken(InvalidHookPayload):
+    """The X-Gitlab-Token header does not match the secret token"""
+
+
+def _token_bytes(value, encodings):
+    """value as bytes, for a constant time comparison (hmac.compare_digest
+       only takes ASCII strings)
+    """
+    if isinstance(value, bytes):
+        return value
+    value = u'%s' % value
+    for encoding in encodings:
+        try:
+            return value.encode(encoding)
+        except UnicodeError:
+            pass
+    return value.encode('utf-8', 'replace')
+
+
+def _require(data, *keys):
+    """Raise InvalidHookPayload unless data has all keys"""
+    missing = [key for key in keys if data.get(key) is None]
+    if missing:
+        raise InvalidHookPayload("'%s' payload without %s"
+                                 % (data.get('event_name'),
+                                    ', '.join(missing)))
+
+
+# Project hook payloads: object_kind => project sub-API class name
+_PROJECT_HOOK_CLASSES = {
+    'issue': 'Issue',
+    'merge_request': 'MergeRequest',
+}
+
+# Note payloads: noteable_type => (payload key, project sub-API class name)
+_NOTEABLE_CLASSES = {
+    'Issue': ('issue', 'Issue'),
+    'MergeRequest': ('merge_request', 'MergeRequest'),
+    'Snippet': ('snippet', 'Snippet'),
+}
+
+# System hook payloads: event_name prefix => top-level class name
+_SYSTEM_HOOK_CLASSES = [
+    ('project_', 'Project'),
+    ('user_add_to_team', 'Project.Member'),
+    ('user_remove_from_team', 'Project.Member'),
+    ('user_add_to_group', 'Group.Member'),
+    ('user_remove_from_group', 'Group.Member'),
+    ('user_', 'User'),
+    ('group_', 'Group'),
+    ('key_', 'User.SSHKey'),
+]
+
+_UTC_DATE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2}) UTC$')
+_OFFSET_DATE_RE = re.compile(
+    r'^(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2}) ([+-]\d{2})(\d{2})$')
+
+
+def _normalize_dates(data):
+    """Hook payloads use '2013-12-03 17:23:34 UTC' style dates in places,
+       convert those to the ISO 8601 format the API uses
+    """
+    if isinstance(data, list):
+        return [_normalize_dates(item) for item in data]
+    if isinstance(data, dict):
+        return dict((key, _normalize_dates(val)) for key, val in data.items())
+    if isinstance(data, str):
+        m = _UTC_DATE_RE.match(data)
+        if m:
+            return '%sT%sZ' % m.groups()
+        m = _OFFSET_DATE_RE.match(data)
+        if m:
+            return '%sT%s%s:%s' % m.groups()
+    return data
+
+
+class HookEvent(object):
+    """A received hook event.
+
+       name: 'push', 'issue', 'merge_request', 'project_create', ...
+       project: the Project the event belongs to, if any
+       object: the resource object the event is about, if any
+       objects: additional resource objects (e.g. commits of a push)
+       payload: the raw payload
+    """
+
+    def __init__(self, name, payload, project=None, obj=None, objects=None):
+        self.name = name
+        self.payload = payload
+        self.project = project
+        self.object = obj
+        self.objects = objects or []
+
+    def __repr__(self):
+        return '<HookEvent %s %r>' % (self.name, self.object)
+
+
+class HookReceiver(object):
+    """WSGI application receiving GitLab web hook and system hook events"""
+
+    def __init__(self, gitlab, secret_token=None):
+        self.gitlab = gitlab
+        self.secret_token = secret_token
+        self.resources = {}  # (class path, key path) => latest object
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, event_name, callback=None):
+        """Call callback(event) for every event named event_name ('*' for
+           all events). May also be used as a decorator.
+        """
+        def register(fn):
+            with self._lock:
+                self._subscribers.setdefault(event_name, []).append(fn)
+            return fn
+        if callback is None:
+            return register
+        return register(callback)
+
+    def unsubscribe(self, event_name, callback):
+        with self._lock:
+            self._subscribers.get(event_name, []).remove(callback)
+
+    def get(self, cls_path, *keys):
+        """Return the most recently received object of cls_path (e.g.
+           'Project.MergeRequest') with the given key path, or None
+        """
+        return self.resources.get((cls_path, keys))
+
+    def cached(self, cls_path):
+        """List of received objects of cls_path, suitable for passing to
+           find_<name>(cached=...)
+        """
+        return [obj for (path, keys), obj in list(self.resources.items())
+                if path == cls_path]
+
+    def handle(self, payload, headers=None):
+        """Process a hook payload (a dict or a JSON string) and return the
+           resulting HookEvent
+        """
+        if headers is not None and self.secret_token is not None:
+            token = headers.get('X-Gitlab-Token') or ''
+            # WSGI servers decode header bytes as latin-1
+            if not hmac.compare_digest(
+                    _token_bytes(token, ('latin-1', 'utf-8')),
+                    _token_bytes(self.secret_token, ('utf-8',))):
+                raise InvalidHookToken("invalid X-Gitlab-Token")
+        if not isinstance(payload, dict):
+            try:
+                if isinstance(payload, bytes):
+                    payload = payload.decode('utf-8')
+                payload = json.loads(payload)
+            except ValueError:
+                raise InvalidHookPayload("payload is not valid JSON")
+        if not isinstance(payload, dict):
+            raise InvalidHookPayload("payload is not a JSON object")
+        data = _normalize_dates(payload)
+        if 'event_name' not in data and 'object_kind' not in data:
+            raise InvalidHookPayload("neither 'object_kind' nor 'event_name'"
+                                     " in payload")
+        try:
+            if 'event_name' in data:
+                event = self._system_event(data)
+            else:
+                event = self._project_event(data)
+        except InvalidHookPayload:
+            raise
+        except (AttributeError, TypeError, ValueError) as e:
+            # Nested values of the wrong shape, e.g. "project": "x"
+            raise InvalidHookPayload("malformed payload: %s" % e)
+        event.payload = payload
+        self._update_cache(event)
+        self._notify(event)
+        return event
+
+    def _project(self, project_id, data=None):
+        project_data = dict(data or {})
+        project_data['id'] = project_id
+        return self.gitlab.Project(self.gitlab, project_data)
+
+    def _project_event(self, data):
+        kind = data['object_kind']
+        attrs = data.get('object_attributes') or {}
+        project_id = data.get('project_id') or attrs.get('project_id') or \
+                     (data.get('project') or {}).get('id')
+        project = None
+        if project_id is not None:
+            project = self._project(project_id, data.get('project'))
+        if project is None:
+            return HookEvent(kind, data)
+        if kind in ('push', 'tag_push'):
+            commits = [project.Commit(project, dict(commit))
+                       for commit in data.get('commits') or []]
+            return HookEvent(kind, data, project, project, commits)
+        if kind in _PROJECT_HOOK_CLASSES:
+            cls = getattr(project, _PROJECT_HOOK_CLASSES[kind])
+            return HookEvent(kind, data, project, cls(project, dict(attrs)))
+        if kind == 'note':
+            noteable = _NOTEABLE_CLASSES.get(attrs.get('noteable_type'))
+            if noteable and data.get(noteable[0]):
+                cls = getattr(project, noteable[1])
+                parent = cls(project, dict(data[noteable[0]]))
+                note = parent.Note(parent, dict(attrs))
+                return HookEvent(kind, data, project, note, [parent])
+        return HookEvent(kind, data, project)
+
+    def _system_event(self, data):
+        name = data['event_name']
+        if data.get('object_kind') in ('push', 'tag_push'):
+            return self._project_event(data)
+        for prefix, cls_path in _SYSTEM_HOOK_CLASSES:
+            if name.startswith(prefix):
+                break
+        else:
+            return HookEvent(name, data)
+        gl = self.gitlab
+        obj_data = dict(data)
+        if cls_path in ('Project', 'Project.Member'):
+            _require(data, 'project_id')
+        elif cls_path == 'Group.Member':
+            _require(data, 'group_id')
+        if cls_path == 'Project':
+            project = self._project(data['project_id'], obj_data)
+            return HookEvent(name, data, project, project)
+        if cls_path == 'Project.Member':
+            project = self._project(data['project_id'])
+            obj_data['id'] = data.get('user_id')
+            return HookEvent(name, data, project,
+                             project.Member(project, obj_data))
+        if cls_path == 'Group.Member':
+            group = gl.Group(gl, {'id': data['group_id']})
+            obj_data['id'] = data.get('user_id')
+            return HookEvent(name, data, None, group.Member(group, obj_data))
+        if cls_path == 'User':
+            obj_data['id'] = data.get('user_id', data.get('id'))
+            return HookEvent(name, data, None, gl.User(gl, obj_data))
+        if cls_path == 'Group':
+            obj_data['id'] = data.get('group_id', data.get('id'))
+            return HookEvent(name, data, None, gl.Group(gl, obj_data))
+        if cls_path == 'User.SSHKey' and 'user_id' in data:
+            user = gl.User(gl, {'id': data['user_id']})
+            return HookEvent(name, data, None, user.SSHKey(user, obj_data))
+        return HookEvent(name, data)
+
+    def _update_cache(self, event):
+        objs = list(event.objects)
+        if event.object is not None:
+            objs.append(event.object)
+        destroyed = event.name.endswith('_destroy') or \
+                    event.name.startswith('user_remove_from_')
+        with self._lock:
+            for obj in objs:
+                if obj._id is None:
+                    continue
+                key = (self._cls_path(obj), tuple(obj._get_keys()))
+                if destroyed and obj is event.object:
+                    self.resources.pop(key, None)
+                else:
+                    self.resources[key] = obj
+
+    @staticmethod
+    def _cls_path(obj):
+        names = []
+        while getattr(obj, '_parent', None) is not None:
+            names.append(type(obj).__name__)
+            obj = obj._parent
+        return '.'.join(reversed(names))
+
+    def _notify(self, event):
+        with self._lock:
+            callbacks = self._subscribers.get(event.name, []) + \
+                        self._subscribers.get('*', [])
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception:
+                log.exception("hook subscriber %r failed on %s",
+                              callback, event.name)
+
+    def __call__(self, environ, start_response):
+        """WSGI entry point"""
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return self._respond(start_response, '405 Method Not Allowed')
+        headers = {
+            'X-Gitlab-Token': environ.get('HTTP_X_GITLAB_TOKEN'),
+            'X-Gitlab-Event': environ.get('HTTP_X_GITLAB_EVENT'),
+        }
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        body = environ['wsgi.input'].read(length)
+        try:
+            self.handle(body, headers)
+        except InvalidHookToken:
+            return self._respond(start_response, '403 Forbidden')
+        except InvalidHookPayload:
+            return self._respond(start_response, '400 Bad Request')
+        return self._respond(start_response, '200 OK')
+
+    @staticmethod
+    def _respond(start_response, status):
+        body = json.dumps({'status': status}).encode('utf-8')
+        start_response(status, [('Content-Type', 'application/json'),
+                                ('Content-Length', str(len(body)))])
+        return [body]
+
+    def make_server(self, host='127.0.0.1', port=8000):
+        """Return a stdlib wsgiref server serving this receiver"""
+        from wsgiref.simple_server import make_server, WSGIRequestHandler
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                log.debug(*args)
+        return make_server(host, port, self, handler_class=QuietHandler)
+
+    def serve(self, host='127.0.0.1', port=8000):
+        """Serve hook requests forever using the stdlib wsgiref server"""
+        self.make_server(host, port).serve_forever()
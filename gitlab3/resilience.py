@@ -0,0 +1,206 @@
+"""
+gitlab3.resilience
+~~~~~~~~~~~~~~~~~~
+
+Policies for taming slow or failing GitLab servers:
+
+HedgingPolicy: if a GET has not been answered within a (recent) latency
+percentile, send a duplicate and use whichever response arrives first.
+
+CircuitBreaker: once the recent error rate for a host crosses a threshold,
+fail fast with exceptions.CircuitOpen instead of piling up more requests;
+after a cool-down single probe requests are let through (half-open) and a
+success closes the circuit again.
+
+    gl = gitlab3.GitLab('http://example.com/', 'token',
+                        hedging=HedgingPolicy(percentile=95),
+                        circuit_breaker=CircuitBreaker(failure_rate=0.5))
+"""
+
+import threading
+import time
+from collections import deque
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from . import _context
+from . import exceptions
+
+
+class HedgingPolicy(object):
+    """Send a duplicate of a slow idempotent request after the given
+       percentile of recently observed latencies
+    """
+
+    def __init__(self, percentile=95, min_samples=20, window=200,
+                 max_hedges=1, min_delay=0.005):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.min_delay = min_delay
+        self.hedges = 0  # duplicates sent so far
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Seconds to wait before hedging, None while too few samples"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        idx = int(round(self.percentile / 100.0 * (len(latencies) - 1)))
+        return max(self.min_delay, latencies[idx])
+
+    def record(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def send(self, fn, on_hedge=None):
+        """Call fn() (which must be idempotent), hedging as needed, and
+           return the first successful result
+        """
+        delay = self.delay()
+        start = time.time()
+        if delay is None:
+            ret = fn()
+            self.record(time.time() - start)
+            return ret
+        cond = threading.Condition()
+        finished = []
+        context = _context.capture()  # e.g. the caller's deadline
+        def attempt():
+            try:
+                with _context.restore(context):
+                    value = (True, fn())
+            except Exception as e:
+                value = (False, e)
+            with cond:
+                finished.append(value)
+                cond.notify_all()
+        attempts = 1
+        _start_thread(attempt)
+        with cond:
+            while True:
+                for ok, value in finished:
+                    if ok:
+                        self.record(time.time() - start)
+                        return value
+                if len(finished) == attempts:  # hedging is not retrying
+                    raise finished[0][1]
+                if attempts <= self.max_hedges:
+                    elapsed = time.time() - start
+                    wait = delay * attempts - elapsed
+                    if wait > 0:
+                        cond.wait(wait)
+                        continue
+                    attempts += 1
+                    self.hedges += 1
+                    if on_hedge is not None:
+                        on_hedge()
+                    _start_thread(attempt)
+                else:
+                    cond.wait()
+
+
+def _start_thread(target):
+    t = threading.Thread(target=target)
+    t.daemon = True
+    t.start()
+
+
+_CLOSED = 'closed'
+_OPEN = 'open'
+_HALF_OPEN = 'half-open'
+
+
+class _Circuit(object):
+    """State of the circuit of a single host"""
+
+    def __init__(self, window):
+        self.state = _CLOSED
+        self.outcomes = deque(maxlen=window)  # True for failures
+        self.opened_at = 0
+        self.probes = 0
+
+
+class CircuitBreaker(object):
+    """Per-host circuit breaker"""
+
+    def __init__(self, failure_rate=0.5, window=20, min_requests=10,
+                 reset_timeout=30.0, half_open_probes=1):
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, host):
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = self._circuits[host] = _Circuit(self.window)
+        return circuit
+
+    def state(self, url):
+        """'closed', 'open' or 'half-open' for the host of url"""
+        with self._lock:
+            return self._circuit(urlparse(url).netloc).state
+
+    def before(self, url):
+        """Raise exceptions.CircuitOpen if a request to url must not be
+           sent now
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            circuit = self._circuit(host)
+            if circuit.state == _CLOSED:
+                return
+            if circuit.state == _OPEN:
+                if time.time() - circuit.opened_at < self.reset_timeout:
+                    raise exceptions.CircuitOpen(
+                        "Circuit open for '%s', request to '%s' not sent"
+                        % (host, url))
+                circuit.state = _HALF_OPEN
+                circuit.probes = 0
+            if circuit.probes >= self.half_open_probes:
+                raise exceptions.CircuitOpen(
+                    "Circuit half-open for '%s', request to '%s' not sent"
+                    % (host, url))
+            circuit.probes += 1
+
+    def record(self, url, failed):
+        """Record the outcome of a request sent to url"""
+        host = urlparse(url).netloc
+        with self._lock:
+            circuit = self._circuit(host)
+            if circuit.state == _HALF_OPEN:
+                circuit.probes -= 1
+                if failed:
+                    circuit.state = _OPEN
+                    circuit.opened_at = time.time()
+                else:
+                    circuit.state = _CLOSED
+                    circuit.outcomes.clear()
+                return
+            circuit.outcomes.append(failed)
+            if circuit.state == _CLOSED and \
+                    len(circuit.outcomes) >= self.min_requests:
+                failures = sum(1 for f in circuit.outcomes if f)
+                if failures >= self.failure_rate * len(circuit.outcomes):
+                    circuit.state = _OPEN
+                    circuit.opened_at = time.time()
+
+    def release(self, url):
+        """Forget a request sent to url whose outcome says nothing about
+           the host (e.g. it failed on the client): frees its half-open
+           probe slot
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            circuit = self._circuit(host)
+            if circuit.state == _HALF_OPEN and circuit.probes > 0:
+                circuit.probes -= 1
@@ -0,0 +1,130 @@
+"""
+gitlab3.scheduler
+~~~~~~~~~~~~~~~~~
+
+Client-side request scheduler. Every request waits for a slot: slots go to
+the highest priority class with waiting requests that is below its own
+concurrency limit, subject to an overall concurrency limit and a token
+bucket rate limit shared by all classes.
+
+    gl = gitlab3.GitLab('http://example.com/', 'token',
+                        scheduler=RequestScheduler(limits={'batch': 4},
+                                                   rate=10, burst=20))
+    with gl.priority('batch'):
+        for path, note in gl.walk(['projects', 'merge_requests', 'notes']):
+            ...
+    gl.projects(priority='interactive')
+"""
+
+import threading
+import time
+from collections import deque
+
+from . import _context
+from . import exceptions
+
+
+class RequestScheduler(object):
+    """Priority classes (highest first) with per-class concurrency limits
+       and a shared token bucket of 'rate' requests per second
+    """
+
+    def __init__(self, priorities=('interactive', 'normal', 'batch'),
+                 limits=None, max_concurrency=None, rate=None, burst=None,
+                 default='normal'):
+        if default not in priorities:
+            raise ValueError("default priority '%s' is not one of %r"
+                             % (default, priorities))
+        self.priorities = tuple(priorities)
+        self.limits = dict(limits or {})
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst or (rate and max(1, rate))
+        self.default = default
+        self.active = dict((name, 0) for name in self.priorities)
+        self._waiting = dict((name, deque()) for name in self.priorities)
+        self._total = 0
+        self._tokens = self.burst
+        self._refilled = time.time()
+        self._cond = threading.Condition(threading.Lock())
+
+    def waiting(self, priority=None):
+        """Number of requests waiting (in one priority class)"""
+        with self._cond:
+            if priority is not None:
+                return len(self._waiting[priority])
+            return sum(len(q) for q in self._waiting.values())
+
+    def _next(self):
+        """The ticket of the request to run next, if any may run. Lock
+           held.
+        """
+        if self.max_concurrency is not None and \
+                self._total >= self.max_concurrency:
+            return None
+        for name in self.priorities:
+            queue = self._waiting[name]
+            limit = self.limits.get(name)
+            if queue and (limit is None or self.active[name] < limit):
+                return queue[0]
+        return None
+
+    def _take_token(self):
+        """Take a token from the bucket; return 0, or the seconds until a
+           token is available. Lock held.
+        """
+        if self.rate is None:
+            return 0
+        now = time.time()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / float(self.rate)
+
+    def acquire(self, priority=None):
+        """Block until a request of the given priority (by default the
+           one of the current context) may be sent. Returns the priority
+           to pass to release().
+        """
+        if priority is None:
+            priority = _context.get('priority') or self.default
+        if priority not in self._waiting:
+            raise ValueError("Unknown priority '%s'" % priority)
+        when = _context.get('deadline')
+        ticket = object()
+        with self._cond:
+            queue = self._waiting[priority]
+            queue.append(ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._next() is ticket:
+                        wait = self._take_token()
+                        if not wait:
+                            break
+                    if when is not None:
+                        remaining = when - time.time()
+                        if remaining <= 0:
+                            raise exceptions.DeadlineExceeded(
+                                "Deadline exceeded waiting for a '%s' "
+                                "request slot" % priority)
+                        wait = min(wait or remaining, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+            queue.popleft()
+            self.active[priority] += 1
+            self._total += 1
+            self._cond.notify_all()  # the next in line may be able to run
+        return priority
+
+    def release(self, priority):
+        with self._cond:
+            self.active[priority] -= 1
+            self._total -= 1
+            self._cond.notify_all()
@@ -0,0 +1,160 @@
+"""
+gitlab3.tokens
+~~~~~~~~~~~~~~
+
+Pool of access tokens (e.g. of several service accounts) spreading the
+requests of a connection over their per-user rate limits. Every request
+goes out with the token picked by the pool's strategy:
+
+'least_recent': the token with the fewest requests in flight, then the
+least recently used one.
+
+'budget': the token with the most requests left according to the
+RateLimit-Remaining header of its responses, then as 'least_recent'.
+
+A token answered with 401 Unauthorized or 429 Too Many Requests is parked
+(after a 429 until RateLimit-Reset or Retry-After, if GitLab sent them)
+and the request is sent again with a token not tried yet. Requests wait
+while every token is parked.
+
+    gl = gitlab3.GitLab('http://example.com/',
+                        token_pool=TokenPool(['token1', 'token2']))
+    gl.token_pool.status()
+"""
+
+import threading
+import time
+
+from . import _context
+from . import exceptions
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Token(object):
+    """Health and rate limit budget of a token"""
+
+    def __init__(self, value):
+        self.value = value
+        self.in_flight = 0
+        self.last_used = 0
+        self.requests = 0
+        self.failures = 0  # 401 and 429 responses
+        self.remaining = None  # requests left until 'reset'
+        self.reset = None
+        self.parked_until = 0
+
+
+class TokenPool(object):
+    """Access tokens to send requests with, picked by 'strategy'
+       ('least_recent' or 'budget'). A token is parked for park_seconds
+       after a 429 without a reset time, and for unauthorized_park_seconds
+       after a 401.
+    """
+
+    def __init__(self, tokens, strategy='least_recent', park_seconds=60,
+                 unauthorized_park_seconds=600):
+        if strategy not in ('least_recent', 'budget'):
+            raise ValueError("Unknown strategy '%s'" % strategy)
+        self._tokens = [_Token(value) for value in tokens]
+        if not self._tokens:
+            raise ValueError("a TokenPool needs at least one token")
+        self._by_value = dict((token.value, token) for token in self._tokens)
+        self.strategy = strategy
+        self.park_seconds = park_seconds
+        self.unauthorized_park_seconds = unauthorized_park_seconds
+        self._cond = threading.Condition(threading.Lock())
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _rank(self, token, now):
+        """Sort key of the tokens ready to be used, best first"""
+        if self.strategy == 'budget':
+            remaining = token.remaining
+            if remaining is None or (token.reset and now >= token.reset):
+                remaining = float('inf')  # unknown or renewed
+            return (-remaining, token.in_flight, token.last_used)
+        return (token.in_flight, token.last_used)
+
+    def acquire(self, exclude=()):
+        """Block until a token (not in exclude) is available and return
+           it, to pass to release() after the request. Returns None if
+           every token is excluded.
+        """
+        when = _context.get('deadline')
+        with self._cond:
+            while True:
+                now = time.time()
+                tokens = [t for t in self._tokens if t.value not in exclude]
+                if not tokens:
+                    return None
+                ready = [t for t in tokens if t.parked_until <= now]
+                if ready:
+                    token = min(ready, key=lambda t: self._rank(t, now))
+                    token.in_flight += 1
+                    token.last_used = now
+                    token.requests += 1
+                    if token.remaining:
+                        token.remaining -= 1  # until the response tells
+                    return token.value
+                wait = min(t.parked_until for t in tokens) - now
+                if when is not None:
+                    remaining = when - now
+                    if remaining <= 0:
+                        raise exceptions.DeadlineExceeded(
+                            "Deadline exceeded waiting for an access token")
+                    wait = min(wait, remaining)
+                self._cond.wait(wait)
+
+    def release(self, value, status_code=None, headers=None):
+        """Return a token after its request, updating its health and
+           budget from the response (if there is one)
+        """
+        headers = headers or {}
+        with self._cond:
+            token = self._by_value[value]
+            token.in_flight -= 1
+            now = time.time()
+            remaining = _int(headers.get('RateLimit-Remaining'))
+            if remaining is not None:
+                token.remaining = remaining
+            reset = _int(headers.get('RateLimit-Reset'))  # epoch seconds
+            if reset is not None:
+                token.reset = reset
+            if status_code == 429:
+                token.failures += 1
+                retry_after = _int(headers.get('Retry-After'))
+                if retry_after is not None:
+                    until = now + retry_after
+                elif token.reset and token.reset > now:
+                    until = token.reset
+                else:
+                    until = now + self.park_seconds
+                token.parked_until = max(token.parked_until, until)
+            elif status_code == 401:
+                token.failures += 1
+                token.parked_until = now + self.unauthorized_park_seconds
+            elif token.remaining == 0 and token.reset and token.reset > now:
+                token.parked_until = token.reset  # no budget left
+            self._cond.notify_all()
+
+    def status(self):
+        """Health of every token: a list of dicts (tokens are shortened
+           to their last 4 characters)
+        """
+        now = time.time()
+        with self._cond:
+            return [{
+                'token': '...' + str(t.value)[-4:],
+                'in_flight': t.in_flight,
+                'requests': t.requests,
+                'failures': t.failures,
+                'remaining': t.remaining,
+                'parked_for': max(0, t.parked_until - now),
+            } for t in self._tokens]